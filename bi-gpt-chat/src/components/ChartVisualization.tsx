@@ -244,7 +244,21 @@ export const ChartVisualization: React.FC<ChartVisualizationProps> = ({ visualiz
     <Card className="p-4 mt-4">
       <div className="space-y-3">
         <div className="flex items-center justify-between">
-          <h4 className="text-lg font-semibold">{meta.title}</h4>
+          <div>
+            <h4 className="text-lg font-semibold">{meta.title}</h4>
+            {meta.original_points && (
+              <p className="text-xs text-muted-foreground">
+                Показано {data.length.toLocaleString('ru-RU')} из {meta.original_points.toLocaleString('ru-RU')} точек
+              </p>
+            )}
+            {meta.rows_scope && meta.fetched_rows && (
+              <p className="text-xs text-muted-foreground">
+                {meta.rows_scope === 'all'
+                  ? `По всем строкам запроса; в таблице первые ${meta.fetched_rows.toLocaleString('ru-RU')}`
+                  : `По первым ${meta.fetched_rows.toLocaleString('ru-RU')} строкам результата`}
+              </p>
+            )}
+          </div>
           <span className="text-sm text-muted-foreground bg-muted px-2 py-1 rounded">
             {chart_type.toUpperCase()}
           </span>
@@ -55,6 +55,17 @@ export const SQLResult = ({ response }: SQLResultProps) => {
         </div>
       )}
       
+      {/* Truncated fetch: the result holds only the query's first rows */}
+      {response.success && response.exec_result?.truncated && (
+        <div className="flex items-center gap-2 text-amber-600">
+          <AlertTriangle className="w-4 h-4" />
+          <span className="text-sm">
+            Получены первые {(response.exec_result.row_count ?? 0).toLocaleString('ru-RU')} строк
+            {response.exec_result.est_rows ? ` из ≈${Number(response.exec_result.est_rows).toLocaleString('ru-RU')}` : ''}
+          </span>
+        </div>
+      )}
+
       {/* SQL Query */}
       {sql && (
         <Card className={response.success ? "" : "border-red-200 bg-red-50"}>
@@ -3,6 +3,9 @@ const API_BASE_URL = 'https://bi-gpt.enbekqor.kz';
 export interface ChatRequest {
   message: string;
   context?: string;
+  verbose?: boolean;
+  // chart_ids this client holds; the server then sends those charts as {"$chart": id}
+  known_charts?: string[];
 }
 
 export interface ChartData {
@@ -18,12 +21,20 @@ export interface ChartMeta {
   x_label: string;
   y_label: string;
   tooltip_fields: string[];
+  // set when the server sent a downsampled series
+  original_points?: number;
+  downsampling?: 'lttb' | 'grid_sample';
+  // set when the result was fetched only up to its first rows
+  rows_scope?: 'all' | 'first';
+  fetched_rows?: number;
 }
 
 export interface Visualization {
   chart_type: 'histogram' | 'pie' | 'scatter' | 'line' | 'error' | 'none';
   meta: ChartMeta;
   data: ChartData[];
+  // content address of the payload, fetchable again from /charts/{chart_id}
+  chart_id?: string;
 }
 
 export interface ChatResponse {
@@ -44,13 +55,73 @@ export interface ApiError {
   status?: number;
 }
 
+// Compact /chat bodies reference shared payloads as {"$ref": id} and send rows columnar.
+type Columnar = Record<string, any[]>;
+
+const fromColumnar = (columns: Columnar): Record<string, any>[] => {
+  const keys = Object.keys(columns);
+  const length = keys.length ? columns[keys[0]].length : 0;
+  return Array.from({ length }, (_, i) =>
+    Object.fromEntries(keys.map((key) => [key, columns[key][i]]))
+  );
+};
+
+const expandArtifact = (artifact: any): any =>
+  artifact && artifact.data_format === 'columnar'
+    ? { ...artifact, data: fromColumnar(artifact.data), data_format: undefined }
+    : artifact;
+
+const resolveRefs = (value: any, artifacts: Record<string, any>): any => {
+  if (Array.isArray(value)) return value.map((v) => resolveRefs(v, artifacts));
+  if (value && typeof value === 'object') {
+    if (typeof value.$ref === 'string' && Object.keys(value).length === 1) {
+      return artifacts[value.$ref];
+    }
+    return Object.fromEntries(
+      Object.entries(value).map(([k, v]) => [k, resolveRefs(v, artifacts)])
+    );
+  }
+  return value;
+};
+
+export const expandChatResponse = (raw: any): ChatResponse => {
+  if (raw?.format !== 'compact') return raw;
+  const artifacts = Object.fromEntries(
+    Object.entries(raw.artifacts || {}).map(([id, a]) => [id, expandArtifact(a)])
+  );
+  const { artifacts: _artifacts, format: _format, ...rest } = raw;
+  return resolveRefs(rest, artifacts);
+};
+
+// Chart payloads kept by chart_id, so a repeated chart is not downloaded again.
+const MAX_KNOWN_CHARTS = 20;
+
 class ApiService {
   private baseUrl: string;
+  private charts = new Map<string, Visualization>();
 
   constructor(baseUrl: string = API_BASE_URL) {
     this.baseUrl = baseUrl;
   }
 
+  private rememberChart(chart: Visualization | undefined): void {
+    if (!chart?.chart_id || !Array.isArray(chart.data)) return;
+    this.charts.delete(chart.chart_id);
+    this.charts.set(chart.chart_id, chart);
+    while (this.charts.size > MAX_KNOWN_CHARTS) {
+      this.charts.delete(this.charts.keys().next().value as string);
+    }
+  }
+
+  // {"$chart": id} artifacts: from the charts held here, else GET /charts/{id}
+  private async resolveCharts(raw: any): Promise<void> {
+    const artifacts = raw?.artifacts || {};
+    for (const [id, artifact] of Object.entries<any>(artifacts)) {
+      if (typeof artifact?.$chart !== 'string') continue;
+      artifacts[id] = this.charts.get(artifact.$chart) ?? (await this.getChart(artifact.$chart)) ?? undefined;
+    }
+  }
+
   async sendMessage(request: ChatRequest): Promise<ChatResponse> {
     try {
       const response = await fetch(`${this.baseUrl}/chat`, {
@@ -60,7 +131,7 @@ class ApiService {
           'Content-Type': 'application/json',
         },
         credentials: 'include', // Include cookies
-        body: JSON.stringify(request),
+        body: JSON.stringify({ ...request, known_charts: [...this.charts.keys()] }),
       });
 
       if (!response.ok) {
@@ -71,7 +142,10 @@ class ApiService {
         );
       }
 
-      const data: ChatResponse = await response.json();
+      const raw = await response.json();
+      await this.resolveCharts(raw);
+      const data: ChatResponse = expandChatResponse(raw);
+      this.rememberChart(data.visualization);
       return data;
     } catch (error) {
       if (error instanceof ApiError) {
@@ -85,6 +159,39 @@ class ApiService {
     }
   }
 
+  async getChart(chartId: string): Promise<Visualization | null> {
+    try {
+      // immutable by id, so the browser cache answers repeated loads
+      const response = await fetch(`${this.baseUrl}/charts/${encodeURIComponent(chartId)}`, {
+        method: 'GET',
+        headers: {
+          'Accept': 'application/json',
+        },
+        credentials: 'include', // Include cookies
+      });
+
+      if (response.status === 404) {
+        return null;
+      }
+      if (!response.ok) {
+        throw new ApiError(`HTTP error! status: ${response.status}`, response.status);
+      }
+
+      const chart: Visualization = expandArtifact(await response.json());
+      this.rememberChart(chart);
+      return chart;
+    } catch (error) {
+      if (error instanceof ApiError) {
+        throw error;
+      }
+
+      throw new ApiError(
+        `Network error: ${error instanceof Error ? error.message : 'Unknown error'}`,
+        0
+      );
+    }
+  }
+
   async healthCheck(): Promise<boolean> {
     try {
       const response = await fetch(`${this.baseUrl}/health`, {
@@ -34,6 +34,7 @@ class QueryResult(BaseModel):
     data: Optional[List[Dict[str, Any]]] = None
     error: Optional[str] = None
     row_count: Optional[int] = None
+    columns: Optional[List[Dict[str, str]]] = None
 
 class MetaInfo(BaseModel):
     success: bool
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import gzip
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:  # optional: brotli is preferred when installed and accepted by the client
+    import brotli
+except ImportError:
+    brotli = None
+
+# state keys that are sent once under "artifacts" and referenced everywhere else
+ARTIFACT_KEYS = ("exec_result", "visualization")
+
+
+def ref(artifact_id: str) -> Dict[str, str]:
+    return {"$ref": artifact_id}
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """[{"a": 1, "b": 2}, {"a": 3}] -> {"a": [1, 3], "b": [2, None]}"""
+    columns: Dict[str, None] = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    return {col: [row.get(col) for row in rows] for col in columns}
+
+
+def from_columnar(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def columnar_artifact(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Rows as columns; chart payloads already arrive columnar from the serializer."""
+    data = value.get("data")
+    if isinstance(data, list) and data and all(isinstance(r, dict) for r in data):
+        return {**value, "data": to_columnar(data), "data_format": "columnar"}
+    return value
+
+
+def rows_artifact(value: Any) -> Any:
+    """Columnar payload back as rows, for verbose responses."""
+    if isinstance(value, dict) and value.get("data_format") == "columnar":
+        rows = {k: v for k, v in value.items() if k != "data_format"}
+        rows["data"] = from_columnar(value["data"])
+        return rows
+    return value
+
+
+def verbose_response(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Verbose /chat body: every payload as rows, also where a step repeats it."""
+    expanded = {k: rows_artifact(payload.get(k)) for k in ARTIFACT_KEYS}
+    steps = []
+    for step in payload.get("intermediate_steps") or []:
+        step = dict(step)
+        for key, value in step.items():
+            for artifact_id, artifact in expanded.items():
+                if value is not None and value is payload.get(artifact_id):
+                    step[key] = artifact
+                    break
+        steps.append(step)
+    return {**payload, **expanded, "intermediate_steps": steps}
+
+
+def _same(a: Any, b: Any) -> bool:
+    return a is b or (isinstance(a, dict) and isinstance(b, dict) and a == b)
+
+
+def compact_steps(steps: List[Dict[str, Any]], artifacts: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Replace step values that duplicate an artifact with a reference to it."""
+    out = []
+    for step in steps or []:
+        step = dict(step)
+        for key, value in step.items():
+            for artifact_id, artifact in artifacts.items():
+                if artifact is not None and _same(value, artifact):
+                    step[key] = ref(artifact_id)
+                    break
+        out.append(step)
+    return out
+
+
+def chart_ref(value: Any, known_charts: Iterable[str]) -> Any:
+    """A chart the client already holds as {"$chart": chart_id}; GET /charts/{id} has the payload."""
+    if isinstance(value, dict) and value.get("chart_id") and value["chart_id"] in known_charts:
+        return {"$chart": value["chart_id"]}
+    return value
+
+
+def compact_response(payload: Dict[str, Any], known_charts: Iterable[str] = ()) -> Dict[str, Any]:
+    """Compact /chat body: large payloads appear once, rows are columnar."""
+    artifacts = {k: payload.get(k) for k in ARTIFACT_KEYS if payload.get(k) is not None}
+    body = {k: v for k, v in payload.items() if k not in ARTIFACT_KEYS and k != "intermediate_steps"}
+    body["format"] = "compact"
+    body["intermediate_steps"] = compact_steps(payload.get("intermediate_steps"), artifacts)
+    for artifact_id in artifacts:
+        body[artifact_id] = ref(artifact_id)
+    body["artifacts"] = {k: columnar_artifact(v) for k, v in artifacts.items()}
+    if "visualization" in artifacts:
+        body["artifacts"]["visualization"] = chart_ref(body["artifacts"]["visualization"], set(known_charts))
+    return body
+
+
+def encode_body(payload: Dict[str, Any], accept_encoding: str, min_bytes: int,
+                compact: bool = True) -> Tuple[bytes, Optional[str]]:
+    """JSON-encode and compress above `min_bytes`; returns (body, content-encoding)."""
+    separators = (",", ":") if compact else (", ", ": ")
+    raw = json.dumps(payload, ensure_ascii=False, default=str, separators=separators).encode("utf-8")
+    if len(raw) < min_bytes:
+        return raw, None
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(raw, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(raw, compresslevel=6), "gzip"
+    return raw, None
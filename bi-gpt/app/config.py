@@ -16,6 +16,62 @@ class AppConfig:
     llm_model: str = os.getenv("LLM_MODEL", "llama4scout")
     sql_adapter_base_url: str = os.getenv("SQL_ADAPTER_BASE_URL", "http://localhost:8000")
     mcp_url: str = os.getenv("MCP_URL", "http://localhost:8001/mcp")
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+    llm_max_keepalive_connections: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    llm_keepalive_expiry_seconds: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    llm_deadline_seconds: float = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+    llm_node_deadlines: str = os.getenv("LLM_NODE_DEADLINES", "classify=10,visualize=30,sql_generate=45")
+    llm_hedge_nodes: str = os.getenv("LLM_HEDGE_NODES", "classify,sql_generate,visualize")
+    llm_hedge_min_delay_seconds: float = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "1"))
+    llm_retry_budget_ratio: float = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    llm_queue_timeout_seconds: float = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+    llm_cache_nodes: str = os.getenv("LLM_CACHE_NODES", "classify,sql_generate,visualize")
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+    llm_cache_memory_entries: int = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+    llm_cache_max_bytes: int = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    router_threshold: float = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.85"))
+    schema_cache_ttl_seconds: int = int(os.getenv("SCHEMA_CACHE_TTL_SECONDS", "300"))
+    # SQL drafts generated in parallel; the cheapest one that passes explain runs (1 = no extra drafts)
+    sql_candidates: int = int(os.getenv("SQL_CANDIDATES", "2"))
+    prompt_result_rows: int = int(os.getenv("PROMPT_RESULT_ROWS", "100"))
+    prompt_result_max_chars: int = int(os.getenv("PROMPT_RESULT_MAX_CHARS", "12000"))
+    # spans are appended as OTLP/JSON lines when set, from a background thread, rotated by size
+    trace_export_path: str = os.getenv("TRACE_EXPORT_PATH", "")
+    trace_export_max_bytes: int = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+    trace_export_backups: int = int(os.getenv("TRACE_EXPORT_BACKUPS", "3"))
+    memory_backend: str = os.getenv("MEMORY_BACKEND", "sqlite")  # sqlite | kv
+    memory_db_path: str = os.getenv("MEMORY_DB_PATH", "memory.db")
+    memory_kv_url: str = os.getenv("MEMORY_KV_URL", "redis://localhost:6379/0")
+    memory_pool_size: int = int(os.getenv("MEMORY_POOL_SIZE", "4"))
+    # the ring-buffer read cache is only safe with a single worker per store
+    memory_cache_reads: bool = os.getenv("MEMORY_CACHE_READS", "1" if os.getenv("WEB_CONCURRENCY", "1") == "1" else "0") == "1"
+    memory_history_size: int = int(os.getenv("MEMORY_HISTORY_SIZE", "3"))
+    memory_cached_sessions: int = int(os.getenv("MEMORY_CACHED_SESSIONS", "10000"))
+    memory_flush_interval_seconds: float = float(os.getenv("MEMORY_FLUSH_INTERVAL_SECONDS", "0.5"))
+    # rolling summary and facts given to prompts; stays this size however long the conversation
+    memory_context_tokens: int = int(os.getenv("MEMORY_CONTEXT_TOKENS", "300"))
+    memory_flush_batch: int = int(os.getenv("MEMORY_FLUSH_BATCH", "200"))
+    # sessions idle this long are purged (0 keeps them forever); also the cookie lifetime
+    memory_session_ttl_seconds: int = int(os.getenv("MEMORY_SESSION_TTL_SECONDS", str(30 * 86400)))
+    memory_purge_interval_seconds: float = float(os.getenv("MEMORY_PURGE_INTERVAL_SECONDS", "300"))
+    memory_purge_batch: int = int(os.getenv("MEMORY_PURGE_BATCH", "500"))
+    result_store_frames_per_session: int = int(os.getenv("RESULT_STORE_FRAMES_PER_SESSION", "4"))
+    result_store_max_sessions: int = int(os.getenv("RESULT_STORE_MAX_SESSIONS", "1000"))
+    result_store_max_bytes: int = int(os.getenv("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+    result_store_max_rows: int = int(os.getenv("RESULT_STORE_MAX_ROWS", "50000"))
+    # scatter and line payloads above this many points are downsampled (0 sends every point)
+    chart_max_points: int = int(os.getenv("CHART_MAX_POINTS", "2000"))
+    # results explain expects this big are fetched up to this many rows; their charts
+    # are aggregated by the database over the full query (0 disables)
+    chart_pushdown_min_rows: int = int(os.getenv("CHART_PUSHDOWN_MIN_ROWS", "5000"))
+    # chart payloads kept by content address for reloads and repeated questions (0 disables)
+    chart_cache_max_bytes: int = int(os.getenv("CHART_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    chat_coalesce: bool = os.getenv("CHAT_COALESCE", "1") == "1"
+    response_compress_min_bytes: int = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+    warmup_attempts: int = int(os.getenv("WARMUP_ATTEMPTS", "3"))
+    warmup_step_timeout_seconds: float = float(os.getenv("WARMUP_STEP_TIMEOUT_SECONDS", "20"))
 
 @lru_cache(maxsize=1)
 def get_config() -> AppConfig:
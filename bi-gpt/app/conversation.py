@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional
+
+# Rolling per-session context kept instead of raw message history:
+#   {"summary": ["Q → A", ...], "facts": {"sql", "tables", "filters", "metrics", "group_by"},
+#    "last_question": str, "last_answer": str}
+# Its rendered size is bounded by a token budget, so prompts stay the same
+# size however long the conversation gets.
+
+SUMMARY_LINE_TOKENS = 60
+LAST_ANSWER_TOKENS = 80
+SQL_TOKENS = 150
+
+# which parts of the context each graph node gets
+NODE_CONTEXT = {
+    "classify": ("last_question",),
+    "chitchat": ("summary", "last_exchange"),
+    "sql_generate": ("facts", "summary"),
+    "repair_sql": ("facts",),
+    "analyse": ("summary",),
+    "visualize": (),
+}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s")
+_WS_RE = re.compile(r"\s+")
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 characters per token for mixed Russian/English text; no tokenizer dependency
+    return (len(text) + 3) // 4
+
+
+def clip_tokens(text: str, tokens: int) -> str:
+    text = _WS_RE.sub(" ", text or "").strip()
+    limit = tokens * 4
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _first_sentence(text: str) -> str:
+    text = _WS_RE.sub(" ", text or "").strip()
+    return _SENTENCE_RE.split(text, 1)[0]
+
+
+def sql_facts(sql: Optional[str]) -> Dict[str, Any]:
+    """Tables, WHERE conditions, aggregates and grouping of the outermost SELECT."""
+    if not sql:
+        return {}
+    facts: Dict[str, Any] = {"sql": sql}
+    try:
+        import sqlglot
+        from sqlglot import exp
+
+        select = sqlglot.parse_one(sql, dialect="postgres")
+    except Exception:
+        return facts
+    if not isinstance(select, exp.Select):
+        return facts
+    facts["tables"] = sorted({t.name for t in select.find_all(exp.Table)})
+    where = select.args.get("where")
+    if where is not None:
+        cond = where.this
+        conds = cond.flatten() if isinstance(cond, exp.And) else [cond]
+        facts["filters"] = [c.sql(dialect="postgres") for c in conds]
+    facts["metrics"] = [
+        item.sql(dialect="postgres") for item in select.expressions if item.find(exp.AggFunc)
+    ]
+    group = select.args.get("group")
+    if group is not None:
+        facts["group_by"] = [g.sql(dialect="postgres") for g in group.expressions]
+    return facts
+
+
+def fold_turn(context: Optional[Dict[str, Any]], question: str, answer: str,
+              sql: Optional[str], budget: int) -> Dict[str, Any]:
+    """Add one finished turn and drop the oldest summary lines beyond `budget` tokens."""
+    context = dict(context or {})
+    summary: List[str] = list(context.get("summary") or [])
+    line = clip_tokens(question, SUMMARY_LINE_TOKENS // 2)
+    if answer:
+        line += " → " + clip_tokens(_first_sentence(answer), SUMMARY_LINE_TOKENS // 2)
+    summary.append(line)
+    while len(summary) > 1 and sum(approx_tokens(s) for s in summary) > budget:
+        summary.pop(0)
+    context["summary"] = summary
+    if sql:
+        context["facts"] = sql_facts(sql)
+    context["last_question"] = clip_tokens(question, SUMMARY_LINE_TOKENS)
+    context["last_answer"] = clip_tokens(answer, LAST_ANSWER_TOKENS)
+    return context
+
+
+def _section(part: str, context: Dict[str, Any]) -> List[str]:
+    if part == "last_question" and context.get("last_question"):
+        kind = "data query" if context.get("facts") else "conversation"
+        return [f"Previous question ({kind}): {context['last_question']}"]
+    if part == "last_exchange" and context.get("last_question"):
+        return [f"User: {context['last_question']}", f"Assistant: {context.get('last_answer', '')}"]
+    if part == "facts" and context.get("facts"):
+        facts = context["facts"]
+        out = [f"Last SQL: {clip_tokens(facts['sql'], SQL_TOKENS)}"]
+        if facts.get("filters"):
+            out.append("Last filters: " + "; ".join(facts["filters"]))
+        if facts.get("metrics"):
+            out.append("Last metric: " + ", ".join(facts["metrics"]))
+        if facts.get("group_by"):
+            out.append("Last grouping: " + ", ".join(facts["group_by"]))
+        return out
+    if part == "summary" and context.get("summary"):
+        return ["Conversation so far:"] + [f"- {line}" for line in context["summary"]]
+    return []
+
+
+def render_context(context: Optional[Dict[str, Any]], node: str, budget: int) -> str:
+    """The part of the context `node` needs, at most `budget` tokens (oldest summary lines go first)."""
+    if not context:
+        return ""
+    parts = NODE_CONTEXT.get(node, ())
+    sections = {part: _section(part, context) for part in parts}
+    summary = sections.get("summary") or []
+
+    def size() -> int:
+        return sum(approx_tokens(line) for lines in sections.values() for line in lines)
+
+    while len(summary) > 1 and size() > budget:
+        del summary[1]
+        if len(summary) == 1:
+            summary.clear()
+    return "\n".join(line for part in parts for line in sections[part])
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from app.config import get_config
+from app.tracing import register_gauge
+
+
+def chart_key(frame: pd.DataFrame, chart_type: str, options: Dict[str, Any],
+              sql: Optional[str] = None) -> Optional[str]:
+    """Content address of a chart: hash of the query, result rows, chart type and resolved options.
+
+    `options` is the chart spec without its generated title. None when the
+    rows can't be hashed (nested JSON cells).
+    """
+    try:
+        rows = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    except (TypeError, ValueError):
+        return None
+    header = json.dumps(
+        {"columns": [str(c) for c in frame.columns], "chart_type": chart_type, "options": options, "sql": sql},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    digest = hashlib.sha256(header.encode("utf-8"))
+    digest.update(rows.tobytes())
+    return digest.hexdigest()[:32]
+
+
+class ChartCache:
+    """LRU of chart payloads by content address, bounded by their JSON size.
+
+    A reloaded chart or a repeated question over the same rows, from any
+    session, gets the stored payload instead of aggregating and serializing
+    it again; GET /charts/{id} serves the same entries.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls) -> "ChartCache":
+        return cls(max_bytes=get_config().chart_cache_max_bytes)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, chart_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(chart_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(chart_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, chart_id: str, payload: Dict[str, Any]) -> None:
+        if self.max_bytes <= 0:
+            return
+        size = len(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(chart_id, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[chart_id] = (payload, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+
+chart_cache = ChartCache.from_config()
+register_gauge("bigpt_chart_cache_entries", lambda: len(chart_cache))
+register_gauge("bigpt_chart_cache_bytes", lambda: chart_cache.nbytes)
+register_gauge("bigpt_chart_cache_hits_total", lambda: chart_cache.hits)
+register_gauge("bigpt_chart_cache_misses_total", lambda: chart_cache.misses)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Chart queries: the chart's aggregation run by the database over the
+# result query, so only bins and groups come back instead of every row.
+# Each builder returns None when the chart can't be expressed in SQL and
+# the caller falls back to computing it in pandas (visual.py).
+
+SUBQUERY_ALIAS = "q"
+
+# visual.py aggregate name -> SQL aggregate
+AGGREGATES = {"sum": "SUM", "mean": "AVG", "count": "COUNT", "min": "MIN", "max": "MAX"}
+
+# pandas resample frequency -> date_trunc unit; pandas labels weeks by their
+# Sunday, so week buckets are resampled once more after the query
+TIME_UNITS = {"h": "hour", "H": "hour", "D": "day", "W": "week", "MS": "month", "QS": "quarter", "YS": "year", "AS": "year"}
+
+
+def _parse(sql: str) -> Optional[Any]:
+    import sqlglot
+    from sqlglot import exp
+
+    try:
+        query = sqlglot.parse_one((sql or "").strip().rstrip(";"), dialect="postgres")
+    except Exception:
+        return None
+    return query if isinstance(query, exp.Query) else None
+
+
+def _limit(query: Any) -> Optional[int]:
+    limit = query.args.get("limit")
+    if limit is None:
+        return None
+    try:
+        return int(limit.expression.name)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def capped_query(sql: str, max_rows: int) -> Optional[str]:
+    """The result query fetching at most max_rows rows, or None when it already does."""
+    query = _parse(sql)
+    if query is None:
+        return None
+    limit = _limit(query)
+    if limit is not None and limit <= max_rows:
+        return None
+    # the query's own ORDER BY still picks which rows come first
+    return _to_sql(query.limit(max_rows))
+
+
+def _source(sql: str) -> Optional[Any]:
+    """The result query, LIMIT included, as a subquery: the chart covers exactly its rows."""
+    query = _parse(sql)
+    if query is None:
+        return None
+    return query.subquery(SUBQUERY_ALIAS)
+
+
+def _col(name: str) -> Any:
+    from sqlglot import exp
+
+    return exp.column(name, table=SUBQUERY_ALIAS, quoted=True)
+
+
+def _not_null(name: str) -> Any:
+    from sqlglot import exp
+
+    return exp.Not(this=exp.Is(this=_col(name), expression=exp.Null()))
+
+
+def _aggregate(aggregate: str, value: Optional[Any], key: str) -> Optional[Any]:
+    from sqlglot import exp
+
+    func = AGGREGATES.get(aggregate)
+    if func is None:
+        return None
+    # rows are counted by their group key (rows with a NULL key are dropped
+    # anyway); COUNT(*) would trip the wildcard check of the SQL validator
+    if func == "COUNT" or value is None:
+        return exp.Count(this=_col(key))
+    return exp.func(func, value)
+
+
+def _to_sql(select: Any) -> Optional[str]:
+    try:
+        return select.sql(dialect="postgres")
+    except Exception:
+        return None
+
+
+def histogram_range_query(sql: str, x_field: str) -> Optional[str]:
+    """MIN and MAX of the histogram column, to place the bins."""
+    from sqlglot import exp
+
+    source = _source(sql)
+    if source is None:
+        return None
+    select = exp.select(
+        exp.alias_(exp.func("MIN", _col(x_field)), "lo", quoted=True),
+        exp.alias_(exp.func("MAX", _col(x_field)), "hi", quoted=True),
+    ).from_(source)
+    return _to_sql(select)
+
+
+def histogram_edges(lo: Any, hi: Any, bins: int) -> Optional[np.ndarray]:
+    """The bins+1 edges np.histogram would use for values in [lo, hi]."""
+    if lo is None or hi is None:
+        return None
+    try:
+        lo, hi = float(lo), float(hi)
+    except (TypeError, ValueError):
+        return None
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        return None
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def histogram_query(sql: str, x_field: str, edges: np.ndarray) -> Optional[str]:
+    """Per-bin counts via width_bucket over the given edges."""
+    from sqlglot import exp
+
+    source = _source(sql)
+    if source is None:
+        return None
+    bucket = exp.func(
+        "WIDTH_BUCKET", _col(x_field),
+        exp.Literal.number(repr(float(edges[0]))), exp.Literal.number(repr(float(edges[-1]))),
+        exp.Literal.number(len(edges) - 1),
+    )
+    select = (
+        exp.select(exp.alias_(bucket, "bucket", quoted=True), exp.alias_(exp.Count(this=_col(x_field)), "count", quoted=True))
+        .from_(source)
+        .where(_not_null(x_field))
+        .group_by(exp.Literal.number(1))
+    )
+    return _to_sql(select)
+
+
+def histogram_counts(rows: List[Dict[str, Any]], bins: int) -> np.ndarray:
+    counts = np.zeros(bins, dtype=np.int64)
+    for row in rows:
+        bucket = int(row["bucket"])
+        # width_bucket puts the maximum in bins+1; np.histogram closes the last bin
+        counts[min(max(bucket, 1), bins) - 1] += int(row["count"])
+    return counts
+
+
+def group_query(sql: str, chart_type: str, options: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Grouped query for a pie or line chart and the options to redraw it from the groups.
+
+    The groups keep the original column names, so the usual payload builder
+    runs on them and yields the same meta; counts come back as a sum.
+    """
+    from sqlglot import exp
+
+    # mirror the pandas builders: pie and categorical lines only know mean and sum,
+    # a resampled line takes any aggregate the resampler has
+    if chart_type == "pie":
+        key, y_field = options["group_by"], options.get("y_field")
+        aggregate = options.get("aggregate", "sum")
+        if aggregate == "count" or not y_field:
+            aggregate, y_field = "count", "value"
+        elif aggregate != "mean":
+            aggregate = "sum"
+        key_expr = _col(key)
+        value = _col(y_field) if aggregate != "count" else None
+        where = None
+    elif chart_type == "line":
+        key, y_field = options["x_field"], options["y_field"]
+        aggregate = options.get("aggregate", "mean")
+        time_freq = options.get("time_freq", "D")
+        if time_freq:
+            unit = TIME_UNITS.get(time_freq)
+            if unit is None:
+                return None
+            key_expr = exp.func("DATE_TRUNC", exp.Literal.string(unit), _col(key))
+            # the pandas path counts missing values as 0 before resampling
+            value = exp.func("COALESCE", _col(y_field), exp.Literal.number(0))
+            where = _not_null(key)
+        else:
+            if aggregate != "mean":
+                aggregate = "sum"
+            key_expr, value, where = _col(key), _col(y_field), None
+    else:
+        return None
+    if key == y_field:
+        return None
+    agg = _aggregate(aggregate, value, key)
+    source = _source(sql)
+    if agg is None or source is None:
+        return None
+    select = exp.select(
+        exp.alias_(key_expr, key, quoted=True), exp.alias_(agg, y_field, quoted=True)
+    ).from_(source).group_by(exp.Literal.number(1))
+    if where is not None:
+        select = select.where(where)
+    query = _to_sql(select)
+    if query is None:
+        return None
+    # one row per group, so aggregating it again changes nothing; counts are summed
+    regroup = "sum" if aggregate == "count" else aggregate
+    if chart_type == "pie":
+        redraw = {**options, "group_by": key, "y_field": y_field, "aggregate": regroup}
+    else:
+        redraw = {**options, "x_field": key, "y_field": y_field, "aggregate": regroup}
+    return query, redraw
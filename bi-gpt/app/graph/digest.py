@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from .visual import profile_frame
+
+# Results at or under these bounds are passed to prompts untouched.
+SMALL_RESULT_ROWS = 100
+MAX_DIGEST_CHARS = 12000
+
+TOP_K = 10
+SAMPLE_ROWS = 5
+MAX_SERIES_POINTS = 24
+MAX_VALUE_CHARS = 120
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _clip(v: Any) -> Any:
+    if isinstance(v, str) and len(v) > MAX_VALUE_CHARS:
+        return v[:MAX_VALUE_CHARS] + "…"
+    return v
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    df = df.astype(object).where(df.notna(), None)
+    return [{k: _clip(v) for k, v in r.items()} for r in df.to_dict(orient="records")]
+
+
+def _numeric_summary(df: pd.DataFrame, cols: List[str]) -> Dict[str, Dict[str, float]]:
+    if not cols:
+        return {}
+    num = df[cols].apply(pd.to_numeric, errors="coerce")
+    stats = num.agg(["count", "sum", "mean", "std", "min", "median", "max"]).T
+    stats = stats.astype(float).round(4)
+    return {col: {k: (None if pd.isna(v) else v) for k, v in row.items()}
+            for col, row in stats.to_dict(orient="index").items()}
+
+
+def _top_categories(df: pd.DataFrame, cols: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    out = {}
+    total = len(df)
+    for col in cols:
+        # counted as text: JSON and array cells (lists, dicts) are unhashable
+        values = df[col].dropna().astype(str)
+        # unique-per-row columns (ids, codes) carry no category signal
+        if values.nunique() == total:
+            continue
+        counts = values.value_counts().head(TOP_K)
+        out[col] = [{"value": _clip(v), "count": int(c), "share": round(c / total, 4)}
+                    for v, c in counts.items()]
+    return out
+
+
+def _time_series(df: pd.DataFrame, time_cols: List[str], numeric_cols: List[str]) -> Dict[str, Any]:
+    if not time_cols or not numeric_cols:
+        return {}
+    col = time_cols[0]
+    ts = pd.to_datetime(df[col], errors="coerce")
+    valid = ts.notna()
+    if not valid.any():
+        return {}
+    num = df.loc[valid, numeric_cols].apply(pd.to_numeric, errors="coerce")
+    num.index = ts[valid]
+    span = ts[valid].max() - ts[valid].min()
+    for freq in ("D", "W", "MS", "QS", "YS"):
+        periods = pd.date_range(ts[valid].min(), ts[valid].max(), freq=freq).size
+        if periods <= MAX_SERIES_POINTS:
+            break
+    agg = num.resample(freq).sum().tail(MAX_SERIES_POINTS)
+    return {
+        "time_column": col,
+        "freq": freq,
+        "span_days": int(span.days),
+        "sum_by_period": {
+            c: [{"period": p.date().isoformat(), "value": round(float(v), 4)} for p, v in agg[c].items()]
+            for c in agg.columns
+        },
+    }
+
+
+def digest_result(exec_result: Optional[Dict[str, Any]], small_rows: int = SMALL_RESULT_ROWS,
+                  max_chars: int = MAX_DIGEST_CHARS) -> str:
+    """Bounded-size JSON view of an exec result for LLM prompts.
+
+    Small results are passed through as-is. Larger ones are replaced by column
+    types, row count, numeric summaries, top categories, head/tail samples and
+    a coarse time series, so prompt size no longer grows with the result.
+    """
+    if not exec_result or not exec_result.get("success") or not exec_result.get("data"):
+        return _dumps(exec_result)
+    rows = exec_result["data"]
+    if len(rows) <= small_rows:
+        raw = _dumps(exec_result)
+        if len(raw) <= max_chars:
+            return raw
+
+    df = pd.DataFrame(rows)
+    profile = profile_frame(df)
+    kinds = {c["name"]: c["kind"] for c in profile}
+    numeric = [c for c, k in kinds.items() if k == "numeric"]
+    temporal = [c for c, k in kinds.items() if k == "temporal"]
+    categorical = [c for c, k in kinds.items() if k == "categorical"]
+
+    digest: Dict[str, Any] = {
+        "success": True,
+        "digest": True,
+        "row_count": len(df),
+        "columns": profile,
+        # the fetch stopped early; the full query is estimated at est_rows rows
+        **({"truncated": True, "est_rows": exec_result.get("est_rows")} if exec_result.get("truncated") else {}),
+        "numeric_summary": _numeric_summary(df, numeric),
+        "top_categories": _top_categories(df, categorical),
+        "time_series": _time_series(df, temporal, numeric),
+        "head": _records(df.head(SAMPLE_ROWS)),
+        "tail": _records(df.tail(SAMPLE_ROWS)),
+    }
+    out = _dumps(digest)
+    # drop the least informative parts until the digest fits
+    for key in ("tail", "time_series", "head", "top_categories"):
+        if len(out) <= max_chars:
+            break
+        digest.pop(key, None)
+        out = _dumps(digest)
+    return out[:max_chars] if len(out) > max_chars else out
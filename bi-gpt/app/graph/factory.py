@@ -1,10 +1,66 @@
-from app.graph.graph import build_bigpt_graph
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
 from app.config import AppConfig
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
 
 _graph = None
+_graph_lock = asyncio.Lock()
+_warmup: Dict[str, Any] = {"ready": False, "steps": {}}
+
+
+def _build(config: AppConfig):
+    # langgraph, langchain_openai, fastmcp and pandas are only imported here
+    from app.graph.graph import build_bigpt_graph
+    return build_bigpt_graph(config)
+
 
 async def get_bigpt_graph(config: AppConfig):
     global _graph
     if _graph is None:
-        _graph = build_bigpt_graph(config)
+        async with _graph_lock:
+            if _graph is None:
+                # the imports and router training are CPU-bound; keep the event loop free
+                _graph = await asyncio.to_thread(_build, config)
     return _graph
+
+
+async def _run_step(name: str, step, config: AppConfig) -> Dict[str, Any]:
+    error = None
+    for attempt in range(1, max(1, config.warmup_attempts) + 1):
+        try:
+            with span(name, kind="warmup") as s:
+                await asyncio.wait_for(step(), timeout=config.warmup_step_timeout_seconds)
+            return {"ok": True, "ms": s.duration_ms, "attempts": attempt}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning("warmup step %s failed (attempt %d): %s", name, attempt, error)
+            if attempt < config.warmup_attempts:
+                await asyncio.sleep(2 ** (attempt - 1))
+    return {"ok": False, "error": error, "attempts": config.warmup_attempts}
+
+
+async def warm_up(
+    config: AppConfig,
+    extra_steps: Optional[Dict[str, Callable[[], Awaitable[Any]]]] = None,
+) -> Dict[str, Any]:
+    """Build the graph and prime MCP, schema cache and LLM connections.
+
+    Failed steps are retried and reported, but do not keep the service from
+    becoming ready: the request path fetches lazily as before.
+    """
+    with span("graph.build", kind="warmup"):
+        graph = await get_bigpt_graph(config)
+    steps = {**getattr(graph, "warmup_steps", {}), **(extra_steps or {})}
+    results = await asyncio.gather(*[_run_step(name, step, config) for name, step in steps.items()])
+    _warmup["steps"] = dict(zip(steps, results))
+    _warmup["ready"] = True
+    logger.info("warmup finished: %s", _warmup["steps"])
+    return _warmup
+
+
+def warmup_status() -> Dict[str, Any]:
+    return _warmup
@@ -1,16 +1,30 @@
 from __future__ import annotations
 
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
+import asyncio
 import json
+import logging
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.tools import BaseTool
+from sqlpolicy import validate_with_policies
 
 from .state import GraphState
 from app.config import AppConfig
 from .mcp_client import MCPClient, MCPProxyTool, MCPExecInput
-from .visual import send_to_tool
+from .visual import histogram_payload, prepare_frame, resolve_options, send_to_tool, recommend_chart
+from . import chart_sql
+from .chart_cache import chart_cache, chart_key
+from .router import FastRouter
+from .llm_client import get_llm_invoker, make_http_client
+from .digest import digest_result
+from .schema_cache import SchemaCache
+from .result_store import result_store
+from app.conversation import render_context
+from app.tracing import traced_node
+
+logger = logging.getLogger(__name__)
 
 
 # ---------- SYSTEM PROMPTS ----------
@@ -44,6 +58,10 @@ ANALYSER_SYSTEM = (
     "DO NOT SWITCH LANGUAGE. IF USER ASKED IN RUSSIAN, ANSWER IN RUSSIAN. IF USER ASKED IN ENGLISH, ANSWER IN ENGLISH."
     "ANSWER ONLY ON ONE LANGUAGE, DO NOT MIX LANGUAGES."
     "currency: KZT"
+    "Large results arrive as a digest (\"digest\": true): row_count, column types, numeric summaries, "
+    "top categories, head/tail samples and period totals instead of every row. Base your answer on it."
+    "When the result has \"truncated\": true, only its first row_count rows were fetched out of about est_rows: "
+    "say so and do not present totals over those rows as totals for the whole query."
 )
 
 VISUALIZE_SYSTEM = (
@@ -65,13 +83,21 @@ VISUALIZE_SYSTEM = (
     "IMPORTANT: Use proper JSON formatting - strings must be in double quotes, numbers must not have quotes. "
     "IMPORTANT: Give good title to the chart according to the user question and the data. do not switch language"
     "IMPORTANT: ANALYSE GIVEN DATA PROPERLY, TO GIVE LABELS"
+    "If the result is a digest (\"digest\": true), take field names from its columns list. "
     "If you're unsure about field names, leave options empty and let the system auto-detect."
     "Example response: {{\"chart_type\": \"histogram\", \"options\": {{\"x_field\": \"age\", \"title\": \"Age Distribution\"}}}}"
 )
 
+CHART_TITLE_SYSTEM = (
+    "You name charts. Given the user question and the chart that was chosen, "
+    "reply with ONLY a short chart title in the user's language. "
+    "No quotes, no markdown, no explanations."
+)
+
 # ---------- LLM FACTORY ----------
 
-def _make_llm(config: AppConfig) -> ChatOpenAI:
+def _make_llm(config: AppConfig, http_client=None) -> ChatOpenAI:
+    # retries are handled by LLMInvoker under a shared budget, not by the openai client
     return ChatOpenAI(
         model=config.llm_model or "llama4scout",
         base_url=config.llm_base_url,
@@ -79,6 +105,8 @@ def _make_llm(config: AppConfig) -> ChatOpenAI:
         max_tokens=2000,
         api_key=config.llm_api_key or "dummy-key",
         model_kwargs={},
+        max_retries=0,
+        http_async_client=http_client or make_http_client(config),
     )
 
 
@@ -103,6 +131,21 @@ sql_prompt = ChatPromptTemplate.from_messages([
      "Return ONLY SQL.")
 ])
 
+repair_prompt = ChatPromptTemplate.from_messages([
+    ("system", SQL_SYSTEM + (
+        "\n\nADDITIONAL HARD RULES:\n"
+        "- Every previous attempt listed below violated policies or limits.\n"
+        "- Fix the query to satisfy policies and limits.\n"
+        "- Return ONLY SQL."
+    )),
+    ("human",
+     "User question:\n{user_input}\n\n"
+     "DB Metainfo (JSON):\n{metainfo}\n\n"
+     "Policies (YAML/JSON):\n{policies}\n\n"
+     "Rejected attempts:\n{attempts}\n\n"
+     "Return ONLY SQL.")
+])
+
 analyser_prompt = ChatPromptTemplate.from_messages([
     ("system", ANALYSER_SYSTEM),
     ("human", "User question:\n{user_input}\n\nSQL execution result (JSON):\n{exec_result}")
@@ -113,6 +156,11 @@ visualize_prompt = ChatPromptTemplate.from_messages([
     ("human", "User question:\n{user_input}\n\nSQL execution result (JSON):\n{exec_result}")
 ])
 
+chart_title_prompt = ChatPromptTemplate.from_messages([
+    ("system", CHART_TITLE_SYSTEM),
+    ("human", "User question:\n{user_input}\n\nChart: {chart_type}\nFields: {fields}")
+])
+
 
 # ---------- VISUALIZATION TOOL ----------
 
@@ -122,10 +170,11 @@ class VisualizationTool(BaseTool):
     name: str = "visualize_data"
     description: str = "Create visualizations from SQL execution results"
     
-    def _run(self, data: List[Dict[str, Any]], chart_type: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+    def _run(self, data: List[Dict[str, Any]], chart_type: str, options: Dict[str, Any] = None,
+             columnar: bool = False) -> Dict[str, Any]:
         """Create visualization payload from data."""
         try:
-            return send_to_tool(chart_type, data, options or {})
+            return send_to_tool(chart_type, data, options or {}, columnar=columnar)
         except Exception as e:
             return {
                 "chart_type": "error",
@@ -133,10 +182,11 @@ class VisualizationTool(BaseTool):
                 "data": []
             }
     
-    async def _arun(self, data: List[Dict[str, Any]], chart_type: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def _arun(self, data: List[Dict[str, Any]], chart_type: str, options: Dict[str, Any] = None,
+                    columnar: bool = False) -> Dict[str, Any]:
         """Create visualization payload from data (async version)."""
         try:
-            return send_to_tool(chart_type, data, options or {})
+            return send_to_tool(chart_type, data, options or {}, columnar=columnar)
         except Exception as e:
             return {
                 "chart_type": "error",
@@ -150,12 +200,51 @@ def _to_text(x: Any) -> str:
     return (getattr(x, "content", None) or str(x or "")).strip()
 
 
+def _structured(result: Any) -> Dict[str, Any]:
+    return getattr(result, "structured_content", None) or {}
+
+
+def _extract_sql(text: str) -> str:
+    """SQL from either a tool-call style JSON reply or plain text."""
+    try:
+        obj = json.loads(text)
+        if isinstance(obj, dict):
+            text = (obj.get("parameters") or {}).get("query") or obj.get("query") or text
+    except (json.JSONDecodeError, TypeError):
+        pass
+    return text.strip().strip("`").replace("```sql", "").replace("```", "").strip()
+
+
+def _explain_outcome(sql: str, explain: Any) -> Dict[str, Any]:
+    data = _structured(explain)
+    violations = list(data.get("violations") or [])
+    if not data.get("success", False):
+        violations.append(data.get("error") or "explain failed")
+    return {
+        "sql": sql,
+        "est_cost": data.get("est_cost"),
+        "est_rows": data.get("est_rows"),
+        "violations": violations,
+        "valid": not violations,
+        "checked": "explain",
+    }
+
+
+def _pick_cheapest(outcomes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    valid = [o for o in outcomes if o["valid"]]
+    if not valid:
+        return None
+    return min(valid, key=lambda o: o["est_cost"] if o["est_cost"] is not None else float("inf"))
+
+
 # ---------- GRAPH ----------
 
 def build_bigpt_graph(config: AppConfig):
-    llm = _make_llm(config)
+    http_client = make_http_client(config)
+    llm = _make_llm(config, http_client)
+    invoker = get_llm_invoker(config)
     mcp_client = MCPClient.from_config()
-
+    router = FastRouter(threshold=config.router_threshold)
 
     t_exec = MCPProxyTool(
         name="sql_exec",
@@ -185,6 +274,22 @@ def build_bigpt_graph(config: AppConfig):
     )
     
     t_visualize = VisualizationTool()
+    schema_cache = SchemaCache(t_meta, t_policies, ttl_seconds=config.schema_cache_ttl_seconds)
+
+    def _result_for_prompt(exec_result):
+        return digest_result(
+            exec_result,
+            small_rows=config.prompt_result_rows,
+            max_chars=config.prompt_result_max_chars,
+        )
+
+    def _with_context(state: GraphState, node: str) -> str:
+        """The user question prefixed with the slice of conversation context this node needs."""
+        question = state.get("user_input") or ""
+        context = render_context(state.get("conversation"), node, config.memory_context_tokens)
+        if not context:
+            return question
+        return f"Previous conversation context:\n{context}\n\nCurrent question: {question}"
 
     llm_with_tools = llm.bind_tools([t_exec, t_explain, t_meta, t_policies], tool_choice="none")
 
@@ -193,167 +298,347 @@ def build_bigpt_graph(config: AppConfig):
     async def n_classify(state: GraphState) -> GraphState:
         text = (state.get("user_input") or "").strip()
 
-        msg = await classifier_prompt.ainvoke({"user_input": text})
-        res = await llm.ainvoke(msg)
-        route_cleaned = _to_text(res).strip().lower()
-        
-        if route_cleaned not in ["sql_query", "other"]:
-            route_cleaned = "other" 
-            
-        print(f"route: {route_cleaned}")
-        state["route"] = route_cleaned
-
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "classify", "output": state["route"]}
-        )
-        return state
+        route_cleaned, confidence = router.predict(text, state.get("conversation"))
+        source = "local"
+        if route_cleaned is None:
+            source = "llm"
+            msg = await classifier_prompt.ainvoke({"user_input": _with_context(state, "classify")})
+            res = await invoker.ainvoke("classify", llm, msg)
+            route_cleaned = _to_text(res).strip().lower()
+
+            if route_cleaned not in ["sql_query", "other"]:
+                route_cleaned = "other"
+
+        logger.info("route=%s source=%s confidence=%.3f", route_cleaned, source, confidence)
+        return {
+            "route": route_cleaned,
+            "intermediate_steps": [
+                {"node": "classify", "output": route_cleaned, "source": source, "confidence": round(confidence, 3)}
+            ],
+        }
 
 
 
 
     # --- chitchat ---
     async def n_chitchat(state: GraphState) -> GraphState:
-        msg = await chitchat_prompt.ainvoke({"user_input": state["user_input"]})
-        res = await llm.ainvoke(msg)
+        msg = await chitchat_prompt.ainvoke({"user_input": _with_context(state, "chitchat")})
+        res = await invoker.ainvoke("chitchat", llm, msg)
         out = _to_text(res)
-        state["final_text"] = out
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "chitchat", "output": out}
-        )
-        return state
+        return {
+            "final_text": out,
+            "intermediate_steps": [{"node": "chitchat", "output": out}],
+        }
 
     async def n_sql_generate(state: GraphState) -> GraphState:
-        metainfo = await t_meta._arun()         
-        policies = await t_policies._arun()
-        print(f"metainfo: {metainfo}")
-        print(f"policies: {policies}")
+        metainfo, policies = await schema_cache.get()
+        router.learn_schema(metainfo, policies)
         msg = await sql_prompt.ainvoke({
-            "user_input": state["user_input"],
+            "user_input": _with_context(state, "sql_generate"),
+            "metainfo": json.dumps(metainfo, ensure_ascii=False, default=str),
+            "policies": json.dumps(policies, ensure_ascii=False, default=str),
+        })
+        # candidates beyond the first use a higher temperature for diversity
+        n = max(1, config.sql_candidates)
+        replies = await asyncio.gather(*[
+            invoker.ainvoke(
+                "sql_generate",
+                llm_with_tools if i == 0 else llm_with_tools.bind(temperature=min(0.1 + 0.3 * i, 1.0)),
+                msg,
+            )
+            for i in range(n)
+        ], return_exceptions=True)
+        candidates: List[str] = []
+        for reply in replies:
+            if isinstance(reply, Exception):
+                logger.warning("sql candidate failed: %s", reply)
+                continue
+            sql = _extract_sql(_to_text(reply))
+            if sql and sql not in candidates:
+                candidates.append(sql)
+        if not candidates:
+            raise next(r for r in replies if isinstance(r, Exception))
+
+        return {
+            "sql": candidates[0],
+            "sql_candidates": candidates,
             "metainfo": metainfo,
             "policies": policies,
-        })
-        res = await llm_with_tools.ainvoke(msg)
-        sql_raw = _to_text(res)           
-        sql_obj = json.loads(sql_raw)
-        sql_query = sql_obj["parameters"]["query"]
-        sql = sql_query.strip().strip("`").replace("```sql", "").replace("```", "").strip()
-
-        state["sql"] = sql
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "sql_generate", "output": sql}
-        )
-        return state
+            "intermediate_steps": [{"node": "sql_generate", "output": candidates[0], "candidates": candidates}],
+        }
 
-    async def n_exec(state: GraphState) -> GraphState:
+    async def _explain_one(sql: str, policies: Dict[str, Any]) -> Dict[str, Any]:
+        # policy violations are caught in-process, without the sql-mcp round trip
+        local = validate_with_policies(sql, policies) if policies else []
+        if local:
+            return {
+                "sql": sql, "est_cost": None, "est_rows": None,
+                "violations": [v.message for v in local],
+                "violation_details": [v.to_dict() for v in local],
+                "valid": False, "checked": "local",
+            }
+        try:
+            explain = await t_explain._arun(request=MCPExecInput(query=sql))
+        except Exception as e:
+            return {"sql": sql, "est_cost": None, "est_rows": None, "violations": [str(e)], "valid": False}
+        return _explain_outcome(sql, explain)
+
+    async def _explain_all(candidates: List[str], policies: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*[_explain_one(sql, policies) for sql in candidates]))
+
+    async def _answer_from_session(state: GraphState, candidates: List[str],
+                                   policies: Dict[str, Any]) -> Optional[GraphState]:
+        """Drill-down on a result this session already has: no explain/exec round trip."""
+        for sql in candidates:
+            if policies and validate_with_policies(sql, policies):
+                continue
+            answered = await result_store.answer(state.get("session_id"), sql)
+            if answered is None:
+                continue
+            data, frame_sql = answered
+            logger.info("answered from session result store")
+            return {
+                "sql": sql,
+                "exec_result": data,
+                "intermediate_steps": [
+                    {"node": "exec", "output": data, "source": "session_result", "from_sql": frame_sql}
+                ],
+            }
+        return None
+
+    def _capped_fetch(outcome: Dict[str, Any], policies: Dict[str, Any]) -> Optional[str]:
+        """The chosen query cut to its first rows when explain expects a big result, else None.
+
+        Decided before the fetch, so a big result never crosses the wire in full;
+        without an estimate the full result is fetched.
+        """
+        est_rows = outcome.get("est_rows")
+        if config.chart_pushdown_min_rows <= 0 or est_rows is None or est_rows < config.chart_pushdown_min_rows:
+            return None
+        capped = chart_sql.capped_query(outcome["sql"], config.chart_pushdown_min_rows)
+        if capped is None or (policies and validate_with_policies(capped, policies)):
+            return None
+        return capped
 
-        explain = await t_explain._arun(request=MCPExecInput(query=state["sql"]))
-        violations = getattr(explain, "violations", []) or []
-        too_costly = getattr(explain, "tooCostly", False) or False
-
-        if violations or too_costly:
-            viol_text = "\n".join(map(str, violations)) or "cost/bytes limit exceeded"
-            repair_system = SQL_SYSTEM + (
-                "\n\nADDITIONAL HARD RULES:\n"
-                f"- Previous attempt violated: {viol_text}\n"
-                "- Fix the query to satisfy policies and limits.\n"
-                "- Return ONLY SQL."
-            )
-            repair_prompt = ChatPromptTemplate.from_messages([
-                ("system", repair_system),
-                ("human", "Rewrite the SQL for this user question:\n{user_input}"),
-            ])
-            repair_msg = await repair_prompt.ainvoke({"user_input": state["user_input"]})
-            repaired = await llm_with_tools.ainvoke(repair_msg)
-            sql_fixed = _to_text(repaired)
-            sql_fixed = sql_fixed.strip().strip("`").replace("```sql", "").replace("```", "").strip()
-
-            state["sql"] = sql_fixed
-            state.setdefault("intermediate_steps", []).append(
-                {"node": "repair_sql", "output": sql_fixed}
+    async def n_exec(state: GraphState) -> GraphState:
+        candidates = state.get("sql_candidates") or [state["sql"]]
+        steps = []
+
+        policies = state.get("policies") or {}
+        local = await _answer_from_session(state, candidates, policies)
+        if local is not None:
+            return local
+        outcomes = await _explain_all(candidates, policies)
+        best = _pick_cheapest(outcomes)
+        steps.append({"node": "explain", "output": outcomes})
+
+        if best is None:
+            attempts = "\n\n".join(
+                f"SQL:\n{o['sql']}\nViolations:\n" + "\n".join(f"- {v}" for v in o["violations"])
+                for o in outcomes
             )
-
-
-        exec_result = await t_exec._arun(request=MCPExecInput(query=state["sql"]))
+            repair_msg = await repair_prompt.ainvoke({
+                "user_input": _with_context(state, "repair_sql"),
+                "metainfo": json.dumps(state.get("metainfo") or {}, ensure_ascii=False, default=str),
+                "policies": json.dumps(state.get("policies") or {}, ensure_ascii=False, default=str),
+                "attempts": attempts,
+            })
+            repaired = await invoker.ainvoke("repair_sql", llm_with_tools, repair_msg)
+            sql_fixed = _extract_sql(_to_text(repaired))
+            outcome = (await _explain_all([sql_fixed], policies))[0] if sql_fixed else None
+            steps.append({"node": "repair_sql", "output": sql_fixed, "explain": outcome})
+            if outcome is None or not outcome["valid"]:
+                # never run SQL that failed validation; the violations are the answer
+                violations = outcome["violations"] if outcome else outcomes[-1]["violations"]
+                data = {"success": False, "error": "; ".join(map(str, violations)), "violations": violations}
+                steps.append({"node": "exec", "output": data, "skipped": True})
+                return {"sql": sql_fixed or candidates[0], "exec_result": data, "intermediate_steps": steps}
+            best = outcome
+
+        sql = best["sql"]
+        capped = _capped_fetch(best, policies)
+        exec_result = await t_exec._arun(request=MCPExecInput(query=capped or sql))
         data = exec_result.structured_content
-        state["exec_result"] = data
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "exec", "output": data}
-        )
-        return state
+        rows = data.get("data") if isinstance(data, dict) and data.get("success") else None
+        # a capped fetch that came back short is the whole result: the estimate was stale
+        if capped and rows is not None and len(rows) >= config.chart_pushdown_min_rows:
+            # only the first rows were fetched; charts aggregate the rest in the database
+            data = {**data, "truncated": True, "est_rows": best["est_rows"]}
+        steps.append({"node": "exec", "output": data, **({"fetched_sql": capped} if capped else {})})
+        return {
+            "sql": sql,
+            "exec_result": data,
+            "intermediate_steps": steps,
+        }
 
     async def n_analyse(state: GraphState) -> GraphState:
         msg = await analyser_prompt.ainvoke({
-            "user_input": state["user_input"],
-            "exec_result": state["exec_result"],
+            "user_input": _with_context(state, "analyse"),
+            "exec_result": _result_for_prompt(state["exec_result"]),
         })
-        res = await llm.ainvoke(msg)
+        res = await invoker.ainvoke("analyse", llm, msg)
         out = _to_text(res)
-        state["final_text"] = out
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "analyse", "output": out}
-        )
-        return state
+        return {
+            "final_text": out,
+            "intermediate_steps": [{"node": "analyse", "output": out}],
+        }
+
+    async def _chart_rows(sql: Optional[str], policies: Dict[str, Any], queries: List[str]) -> Optional[List[Dict[str, Any]]]:
+        if sql is None or (policies and validate_with_policies(sql, policies)):
+            return None
+        queries.append(sql)
+        result = _structured(await t_exec._arun(request=MCPExecInput(query=sql)))
+        return result.get("data") if result.get("success") else None
+
+    def _pushdown_applies(state: GraphState, chart_type: str) -> bool:
+        """Results exec cut short get their chart aggregated by the database over the full query."""
+        exec_data = state.get("exec_result") or {}
+        return bool(exec_data.get("truncated") and state.get("sql")) and chart_type in ("histogram", "pie", "line")
+
+    async def _chart_from_sql(state: GraphState, frame, chart_type: str,
+                              opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Chart aggregated by the database over the result query (options from resolve_options).
+
+        Returns {"payload", "queries"}, or None to draw it from the fetched rows.
+        """
+        sql = state["sql"]
+        if any(opts.get(k) is not None and opts[k] not in frame.columns for k in ("x_field", "y_field", "group_by")):
+            return None
+        policies = state.get("policies") or {}
+        queries: List[str] = []
+        try:
+            if chart_type == "histogram":
+                bins = int(opts["bins"])
+                x_field = opts["x_field"]
+                bounds = await _chart_rows(chart_sql.histogram_range_query(sql, x_field), policies, queries)
+                edges = chart_sql.histogram_edges(bounds[0].get("lo"), bounds[0].get("hi"), bins) if bounds else None
+                if edges is None:
+                    return None
+                counts = await _chart_rows(chart_sql.histogram_query(sql, x_field, edges), policies, queries)
+                if counts is None:
+                    return None
+                payload = histogram_payload(chart_sql.histogram_counts(counts, bins), edges, x_field,
+                                            title=opts.get("title"), columnar=True)
+            else:
+                compiled = chart_sql.group_query(sql, chart_type, opts)
+                if compiled is None:
+                    return None
+                query, redraw = compiled
+                groups = await _chart_rows(query, policies, queries)
+                if not groups:
+                    return None
+                payload = await asyncio.to_thread(send_to_tool, chart_type, groups, redraw, True)
+        except Exception as e:
+            logger.warning("chart pushdown failed, drawing from rows: %s", e)
+            return None
+        return {"payload": payload, "queries": queries}
 
     async def n_visualize(state: GraphState) -> GraphState:
         """Visualization agent that decides chart type and creates visualization."""
         exec_data = state["exec_result"]
         data = exec_data.get("data", [])
         if not data:
-            state["visualization"] = {
-                "chart_type": "error",
-                "meta": {"title": "No Data", "error": "No execution result data available"},
-                "data": []
+            return {
+                "visualization": {
+                    "chart_type": "error",
+                    "meta": {"title": "No Data", "error": "No execution result data available"},
+                    "data": []
+                }
             }
-            return state
         
-        msg = await visualize_prompt.ainvoke({
-            "user_input": state["user_input"],
-            "exec_result": data
-        })
-        res = await llm.ainvoke(msg)
-        visualization_config = _to_text(res).strip().strip("`").replace("```json", "").replace("```", "").strip()
-        print(f"visualization_config: {visualization_config}")
-        try:
-            import json
-            config = json.loads(visualization_config)
-            chart_type = config.get("chart_type", "none")
-            options = config.get("options", {})
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw visualization_config: {visualization_config}")
-            state["visualization"] = {
-                "chart_type": "error",
-                "meta": {"title": "Ошибка создания графика", "x_label": "", "y_label": "", "tooltip_fields": []},
-                "data": []
-            }
-            return state
+        # one cleaned frame serves the recommendation and the chart payload
+        frame = await asyncio.to_thread(prepare_frame, data)
+        recommendation = recommend_chart(frame)
+        source = "rules"
+        if recommendation["confident"]:
+            chart_type = recommendation["chart_type"]
+            options = dict(recommendation["options"])
+        else:
+            source = "llm"
+            msg = await visualize_prompt.ainvoke({
+                "user_input": state["user_input"],
+                "exec_result": _result_for_prompt(exec_data)
+            })
+            res = await invoker.ainvoke("visualize", llm, msg)
+            visualization_config = _to_text(res).strip().strip("`").replace("```json", "").replace("```", "").strip()
+            logger.debug("visualization_config: %s", visualization_config)
+            try:
+                config = json.loads(visualization_config)
+                chart_type = config.get("chart_type", "none")
+                options = config.get("options", {})
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning("visualization config is not valid JSON (%s): %s", e, visualization_config)
+                return {
+                    "visualization": {
+                        "chart_type": "error",
+                        "meta": {"title": "Ошибка создания графика", "x_label": "", "y_label": "", "tooltip_fields": []},
+                        "data": []
+                    }
+                }
         
         if chart_type == "none":
-            state["visualization"] = {
-                "chart_type": "none",
-                "meta": {"title": "No Data", "error": "No data available for visualization"},
-                "data": []
+            return {
+                "visualization": {
+                    "chart_type": "none",
+                    "meta": {"title": "No Data", "error": "No data available for visualization"},
+                    "data": []
+                }
             }
-            return state
 
-        payload = await t_visualize._arun(
-            data=data,
-            chart_type=chart_type,
-            options=options
-        )
+        opts = resolve_options(chart_type, frame, options)
+        # payloads are built columnar, the compact response format; verbose
+        # responses expand them back to rows (app.compact.rows_artifact)
+        pushdown = _pushdown_applies(state, chart_type)
+        # the same query, rows and chart spec give the same chart, whichever
+        # session asks; the title is left out, so a hit skips the title prompt
+        spec = {k: v for k, v in opts.items() if k != "title"}
+        chart_id = chart_key(frame, chart_type, spec, state.get("sql"))
+        payload = chart_cache.get(chart_id) if chart_id else None
+        step = {"node": "visualize", "chart_type": chart_type, "source": source, "chart_id": chart_id}
+        if payload is not None:
+            step["cache"] = "hit"
+        else:
+            if source == "rules":
+                msg = await chart_title_prompt.ainvoke({
+                    "user_input": state["user_input"],
+                    "chart_type": chart_type,
+                    "fields": json.dumps(options, ensure_ascii=False),
+                })
+                res = await invoker.ainvoke("visualize", llm, msg)
+                title = _to_text(res).strip().strip('"').strip()
+                if title:
+                    opts["title"] = title
+            pushed = await _chart_from_sql(state, frame, chart_type, opts) if pushdown else None
+            if pushed is not None:
+                payload = pushed["payload"]
+                step["pushdown"] = pushed["queries"]
+            else:
+                payload = await t_visualize._arun(
+                    data=frame,
+                    chart_type=chart_type,
+                    options=opts,
+                    columnar=True,
+                )
+            if exec_data.get("truncated") and payload.get("chart_type") != "error":
+                # the table holds the first rows only; say which rows the chart covers
+                scope = {"rows_scope": "all" if pushed is not None else "first", "fetched_rows": len(frame)}
+                payload = {**payload, "meta": {**payload.get("meta", {}), **scope}}
+            if chart_id and payload.get("chart_type") != "error":
+                payload = {**payload, "chart_id": chart_id}
+                chart_cache.put(chart_id, payload)
+        step["output"] = payload
         
-        state["visualization"] = payload
-        state.setdefault("intermediate_steps", []).append(
-            {"node": "visualize", "chart_type": chart_type, "output": payload}
-        )
-        return state
+        return {
+            "visualization": payload,
+            "intermediate_steps": [step],
+        }
 
-    graph.add_node("classify", n_classify)
-    graph.add_node("chitchat", n_chitchat)
-    graph.add_node("sql_generate", n_sql_generate)
-    graph.add_node("exec", n_exec)
-    graph.add_node("analyse", n_analyse)
-    graph.add_node("visualize", n_visualize)
+    graph.add_node("classify", traced_node("classify", n_classify))
+    graph.add_node("chitchat", traced_node("chitchat", n_chitchat))
+    graph.add_node("sql_generate", traced_node("sql_generate", n_sql_generate))
+    graph.add_node("exec", traced_node("exec", n_exec))
+    graph.add_node("analyse", traced_node("analyse", n_analyse))
+    graph.add_node("visualize", traced_node("visualize", n_visualize))
 
 
 
@@ -368,8 +653,27 @@ def build_bigpt_graph(config: AppConfig):
     })
     graph.add_edge("chitchat", END)
     graph.add_edge("sql_generate", "exec")
+    # analyse and visualize only need exec_result, so they run in parallel
     graph.add_edge("exec", "analyse")
-    graph.add_edge("analyse", "visualize")
-    graph.add_edge("visualize", END)
+    graph.add_edge("exec", "visualize")
+    graph.add_edge(["analyse", "visualize"], END)
+
+    async def warm_mcp():
+        await mcp_client.list_tools()
+
+    async def warm_schema():
+        metainfo, policies = await schema_cache.refresh()
+        router.learn_schema(metainfo, policies)
+
+    async def warm_llm():
+        # opens a pooled keep-alive connection to the LLM endpoint; the status is irrelevant
+        if config.llm_base_url:
+            await http_client.get(
+                config.llm_base_url.rstrip("/") + "/models",
+                headers={"Authorization": f"Bearer {config.llm_api_key or 'dummy-key'}"},
+            )
 
-    return graph.compile()
+    compiled = graph.compile()
+    # picked up by factory.warm_up on startup
+    compiled.warmup_steps = {"mcp": warm_mcp, "schema": warm_schema, "llm": warm_llm}
+    return compiled
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def completion_key(runnable: Any, msg: Any, kwargs: Dict[str, Any]) -> str:
+    """Hash of model, prompt messages and generation parameters."""
+    bound = getattr(runnable, "bound", runnable)
+    params = {
+        "model": getattr(bound, "model_name", None) or getattr(bound, "model", None) or type(bound).__name__,
+        "temperature": getattr(bound, "temperature", None),
+        "max_tokens": getattr(bound, "max_tokens", None),
+        **(getattr(runnable, "kwargs", None) or {}),
+        **kwargs,
+    }
+    messages = msg.to_messages() if hasattr(msg, "to_messages") else msg
+    payload = {
+        "params": params,
+        "messages": [(getattr(m, "type", "raw"), getattr(m, "content", m)) for m in messages],
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Two-tier completion cache: in-memory LRU in front of a SQLite file.
+
+    The SQLite tier survives restarts and is trimmed by least-recent access
+    once its payload size exceeds `max_disk_bytes`. Only the memory tier is
+    touched on the event loop; disk reads and writes run in a worker thread.
+    """
+
+    def __init__(self, path: str = "llm_cache.db", memory_entries: int = 512,
+                 max_disk_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_last_access ON completions (last_access)")
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        self.hits = {"memory": 0, "disk": 0, "miss": 0}
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        # the memory tier is read on the event loop; only a miss goes to disk
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits["memory"] += 1
+            return self._memory[key]
+        value = await asyncio.to_thread(self._disk_get, key)
+        if value is None:
+            self.hits["miss"] += 1
+            return None
+        self._remember(key, value)
+        self.hits["disk"] += 1
+        return value
+
+    async def put(self, key: str, value: str) -> None:
+        self._remember(key, value)
+        await asyncio.to_thread(self._disk_put, key, value)
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def _disk_put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # keep the most recently used entries that fit in 75% of the budget, in one statement
+        target = int(self.max_disk_bytes * 0.75)
+        freed = self._conn.execute(
+            "DELETE FROM completions WHERE key IN ("
+            " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS running"
+            " FROM completions) WHERE running > ?) RETURNING size",
+            (target,),
+        ).fetchall()
+        self._disk_bytes -= sum(row[0] for row in freed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.hits, "memory_entries": len(self._memory), "disk_bytes": self._disk_bytes}
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+
+import httpx
+import openai
+from langchain_core.messages import AIMessage
+
+from app.config import AppConfig
+from app.tracing import Span, register_gauge, span
+from .llm_cache import CompletionCache, completion_key
+from .llm_scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# Transport-level failures worth another attempt; anything else is returned to the node.
+RETRYABLE_ERRORS = (
+    httpx.TransportError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    openai.RateLimitError,
+)
+
+
+class LLMDeadlineExceeded(Exception):
+    pass
+
+
+def parse_node_seconds(spec: str) -> Dict[str, float]:
+    """"classify=10,analyse=60" -> {"classify": 10.0, "analyse": 60.0}"""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            out[name.strip()] = float(value)
+    return out
+
+
+def parse_names(spec: str) -> set:
+    return {p.strip() for p in (spec or "").split(",") if p.strip()}
+
+
+def make_http_client(config: AppConfig) -> httpx.AsyncClient:
+    """Shared keep-alive pool for every request to the LLM endpoint."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.llm_max_connections,
+            max_keepalive_connections=config.llm_max_keepalive_connections,
+            keepalive_expiry=config.llm_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(config.llm_deadline_seconds, connect=5.0),
+    )
+
+
+class LatencyTracker:
+    """Rolling per-node latency window with percentile queries."""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, node: str, seconds: float) -> None:
+        self._samples.setdefault(node, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, node: str, q: float) -> Optional[float]:
+        samples = sorted(self._samples.get(node) or ())
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[idx]
+
+    def count(self, node: str) -> int:
+        return len(self._samples.get(node) or ())
+
+    def nodes(self) -> Iterable[str]:
+        return list(self._samples)
+
+
+class RetryBudget:
+    """Token bucket: every request earns `ratio` tokens, every retry or hedge spends one.
+
+    Keeps extra load from retries and hedges at roughly `ratio` of normal traffic.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_tokens: float = 3.0, max_tokens: float = 50.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+
+    def on_request(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class LLMInvoker:
+    """Runs LLM calls for graph nodes with deadlines, hedging and budgeted retries."""
+
+    def __init__(
+        self,
+        default_deadline: float = 60.0,
+        node_deadlines: Optional[Dict[str, float]] = None,
+        hedge_nodes: Optional[set] = None,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 1.0,
+        hedge_min_samples: int = 20,
+        max_retries: int = 1,
+        retry_budget: Optional[RetryBudget] = None,
+        cache: Optional[CompletionCache] = None,
+        cache_nodes: Optional[set] = None,
+        scheduler: Optional[FairScheduler] = None,
+    ):
+        self.default_deadline = default_deadline
+        self.node_deadlines = node_deadlines or {}
+        self.hedge_nodes = hedge_nodes or set()
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.cache = cache
+        self.cache_nodes = cache_nodes or set()
+        self.scheduler = scheduler or FairScheduler()
+        self.latency = LatencyTracker()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "LLMInvoker":
+        cache_nodes = parse_names(config.llm_cache_nodes)
+        cache = None
+        if cache_nodes:
+            cache = CompletionCache(
+                path=config.llm_cache_path,
+                memory_entries=config.llm_cache_memory_entries,
+                max_disk_bytes=config.llm_cache_max_bytes,
+            )
+        return cls(
+            default_deadline=config.llm_deadline_seconds,
+            node_deadlines=parse_node_seconds(config.llm_node_deadlines),
+            hedge_nodes=parse_names(config.llm_hedge_nodes),
+            hedge_min_delay=config.llm_hedge_min_delay_seconds,
+            max_retries=config.llm_max_retries,
+            retry_budget=RetryBudget(ratio=config.llm_retry_budget_ratio),
+            cache=cache,
+            cache_nodes=cache_nodes,
+            scheduler=FairScheduler(
+                max_concurrency=config.llm_max_concurrency,
+                max_queue_wait=config.llm_queue_timeout_seconds,
+            ),
+        )
+
+    def _count(self, node: str, key: str) -> None:
+        c = self.counters.setdefault(node, {})
+        c[key] = c.get(key, 0) + 1
+
+    def hedge_delay(self, node: str) -> float:
+        """p95 of recent latencies once there are enough samples, else the configured floor."""
+        if self.latency.count(node) < self.hedge_min_samples:
+            return self.hedge_min_delay
+        return max(self.hedge_min_delay, self.latency.percentile(node, self.hedge_quantile))
+
+    async def _hedged(self, node: str, runnable: Any, msg: Any, kwargs: Dict[str, Any]) -> Any:
+        primary = asyncio.create_task(runnable.ainvoke(msg, **kwargs))
+        tasks = [primary]
+        try:
+            if node not in self.hedge_nodes:
+                return await primary
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(node))
+            # the backup is a real LLM call: it needs a free slot of its own, never a queued one
+            if done or not self.scheduler.try_acquire():
+                return await primary
+            if not self.retry_budget.try_spend():
+                self.scheduler.release()
+                return await primary
+
+            self._count(node, "hedged")
+            backup = asyncio.create_task(runnable.ainvoke(msg, **kwargs))
+            backup.add_done_callback(lambda _: self.scheduler.release())
+            tasks.append(backup)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count(node, "hedge_won")
+                        return task.result()
+            # both failed: surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def ainvoke(self, node: str, runnable: Any, msg: Any, **kwargs: Any) -> Any:
+        with span(node, kind="llm") as s:
+            if self.cache is None or node not in self.cache_nodes:
+                res = await self._scheduled(node, runnable, msg, kwargs, s)
+            else:
+                key = completion_key(runnable, msg, kwargs)
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    self._count(node, "cache_hits")
+                    s.set(cached=True)
+                    return AIMessage(content=cached)
+                res = await self._scheduled(node, runnable, msg, kwargs, s)
+                text = getattr(res, "content", None)
+                if isinstance(text, str) and text:
+                    await self.cache.put(key, text)
+            usage = getattr(res, "usage_metadata", None) or {}
+            s.set(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
+            return res
+
+    async def _scheduled(self, node: str, runnable: Any, msg: Any, kwargs: Dict[str, Any],
+                         s: Span) -> Any:
+        async with self.scheduler.slot() as waited:
+            s.set(queue_ms=round(waited * 1000, 2))
+            return await self._ainvoke(node, runnable, msg, kwargs)
+
+    async def _ainvoke(self, node: str, runnable: Any, msg: Any, kwargs: Dict[str, Any]) -> Any:
+        deadline = self.node_deadlines.get(node, self.default_deadline)
+        started = time.monotonic()
+        self.retry_budget.on_request()
+        attempt = 0
+        while True:
+            remaining = deadline - (time.monotonic() - started)
+            try:
+                res = await asyncio.wait_for(self._hedged(node, runnable, msg, kwargs), timeout=remaining)
+            except asyncio.TimeoutError:
+                self._count(node, "deadline_exceeded")
+                raise LLMDeadlineExceeded(f"LLM call for '{node}' exceeded {deadline:g}s deadline")
+            except RETRYABLE_ERRORS as e:
+                self._count(node, "errors")
+                if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                    raise
+                attempt += 1
+                self._count(node, "retries")
+                logger.warning("llm %s failed (%s), retry %d", node, e, attempt)
+                continue
+            elapsed = time.monotonic() - started
+            self.latency.record(node, elapsed)
+            self._count(node, "calls")
+            return res
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for node in self.latency.nodes():
+            out[node] = {
+                "p50": self.latency.percentile(node, 0.50),
+                "p95": self.latency.percentile(node, 0.95),
+                "p99": self.latency.percentile(node, 0.99),
+                "samples": self.latency.count(node),
+                **self.counters.get(node, {}),
+            }
+        return out
+
+
+_invoker: Optional[LLMInvoker] = None
+
+
+def get_llm_invoker(config: AppConfig) -> LLMInvoker:
+    global _invoker
+    if _invoker is None:
+        _invoker = LLMInvoker.from_config(config)
+        scheduler = _invoker.scheduler
+        register_gauge("bigpt_llm_in_flight", lambda: scheduler.in_use)
+        register_gauge("bigpt_llm_queued", scheduler.queued)
+        register_gauge("bigpt_llm_granted_total", lambda: scheduler.granted)
+        register_gauge("bigpt_llm_rejected_total", lambda: scheduler.rejected)
+    return _invoker
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from app.tracing import histograms
+
+# lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# set per request by the API layer; calls outside a request (warmup) count as batch
+current_session: ContextVar[str] = ContextVar("llm_session", default="-")
+current_priority: ContextVar[str] = ContextVar("llm_priority", default="batch")
+
+
+class LLMBusy(Exception):
+    """No LLM slot would become free within the queue deadline."""
+
+
+def set_request_context(session_id: str, priority: str = "interactive") -> None:
+    """Tag this request's LLM calls; the priority is chosen by the server, never by the client."""
+    current_session.set(session_id or "-")
+    current_priority.set(priority if priority in PRIORITIES else "interactive")
+
+
+class FairScheduler:
+    """Global cap on concurrent LLM calls with per-session round-robin queues.
+
+    Waiters are grouped by priority, then by session; each grant takes the
+    oldest waiter of the session at the head of the highest non-empty
+    priority and moves that session to the back, so one chatty session
+    cannot starve the rest.
+
+    A call whose expected wait (waiters ahead of it times the observed slot
+    hold time, spread over the slots) is beyond `max_queue_wait` gets
+    LLMBusy right away instead of queueing; waiting past the deadline
+    anyway raises it too.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue_wait: float = 10.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_wait = max_queue_wait
+        self.in_use = 0
+        self.granted = 0
+        self.rejected = 0
+        # moving average of how long a slot is held, in seconds (None until the first release)
+        self.service_time: Optional[float] = None
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+
+    def queued(self, max_level: Optional[int] = None) -> int:
+        """Waiters still queued, only those at priority `max_level` or higher when given."""
+        return sum(
+            1 for level, sessions in self._queues.items() if max_level is None or level <= max_level
+            for q in sessions.values() for f in q if not f.done()
+        )
+
+    def expected_wait(self, level: int) -> float:
+        """Seconds a new waiter at `level` would likely queue, from the observed hold time."""
+        if self.service_time is None:
+            return 0.0
+        ahead = self.queued(level) + 1
+        return ahead * self.service_time / self.max_concurrency
+
+    def observe(self, held: float) -> None:
+        self.service_time = held if self.service_time is None else 0.8 * self.service_time + 0.2 * held
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for level in sorted(self._queues):
+            sessions = self._queues[level]
+            while sessions:
+                session, q = next(iter(sessions.items()))
+                fut = q.popleft()
+                if q:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                if not fut.done():
+                    return fut
+        return None
+
+    def _grant_next(self) -> None:
+        while self.in_use < self.max_concurrency:
+            fut = self._next_waiter()
+            if fut is None:
+                return
+            self.in_use += 1
+            fut.set_result(None)
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._grant_next()
+
+    def try_acquire(self) -> bool:
+        """Take a free slot without queueing (hedged backups); False when none is free."""
+        if self.in_use < self.max_concurrency and not self.queued():
+            self.in_use += 1
+            self.granted += 1
+            return True
+        return False
+
+    async def acquire(self, session: str, priority: str) -> float:
+        """Wait for a slot; returns the time spent queued in seconds."""
+        if self.try_acquire():
+            return 0.0
+
+        level = PRIORITIES.get(priority, PRIORITIES["batch"])
+        expected = self.expected_wait(level)
+        if expected > self.max_queue_wait:
+            self.rejected += 1
+            raise LLMBusy(f"LLM is busy: expected wait {expected:.1f}s exceeds {self.max_queue_wait:g}s")
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(level, OrderedDict()).setdefault(session, deque()).append(fut)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()
+                self.rejected += 1
+                raise LLMBusy(f"LLM is busy: no slot within {self.max_queue_wait:g}s")
+        except asyncio.CancelledError:
+            # granted just before the caller went away: hand the slot on
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+            raise
+        self.granted += 1
+        return time.monotonic() - started
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        priority = current_priority.get()
+        waited = await self.acquire(current_session.get(), priority)
+        histograms.observe("llm_queue", priority, waited)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.observe(time.monotonic() - started)
+            self.release()
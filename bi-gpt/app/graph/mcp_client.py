@@ -1,13 +1,14 @@
 from typing import Optional, Type, Any
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
-from fastmcp import Client
 
 from ..config import get_config
+from ..tracing import span, payload_size
 
 class MCPClient:
     def __init__(self, url: str):
-        self.client = Client(url)   
+        from fastmcp import Client  # heavy; only needed once the graph is built
+        self.client = Client(url)
 
     @classmethod
     def from_config(cls):
@@ -20,8 +21,10 @@ class MCPClient:
             return result
 
     async def call(self, tool_name: str, kwargs: dict):
-        async with self.client:
-            result = await self.client.call_tool(tool_name, kwargs)
+        with span(tool_name, kind="mcp", request_bytes=payload_size(kwargs)) as s:
+            async with self.client:
+                result = await self.client.call_tool(tool_name, kwargs)
+            s.set(response_bytes=payload_size(getattr(result, "structured_content", None)))
             return result
 
 class MCPExecInput(BaseModel):
@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.config import get_config
+from app.tracing import register_gauge
+
+FRAME_TABLE = "frame"
+
+
+def _canon(node: Any) -> str:
+    return node.sql(dialect="postgres") if node is not None else ""
+
+
+def _arg(node: Any, name: str) -> Any:
+    # sqlglot renamed "from"/"with" to "from_"/"with_"; accept both
+    return node.args.get(name) or node.args.get(name + "_")
+
+
+def _conjuncts(where: Any) -> List[Any]:
+    from sqlglot import exp
+
+    if where is None:
+        return []
+    node = where.this if isinstance(where, exp.Where) else where
+    return list(node.flatten()) if isinstance(node, exp.And) else [node]
+
+
+def _local_nodes() -> Tuple[type, ...]:
+    """Expression types whose SQLite result matches Postgres (with the functions Frame registers)."""
+    from sqlglot import exp
+
+    return (
+        exp.Column, exp.Identifier, exp.Star, exp.Literal, exp.Boolean, exp.Null, exp.Alias, exp.Paren,
+        exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.And, exp.Or, exp.Not,
+        exp.In, exp.Between, exp.Is, exp.Like, exp.ILike, exp.Escape,
+        exp.Add, exp.Sub, exp.Mul, exp.Neg,
+        exp.Count, exp.Sum, exp.Avg, exp.Min, exp.Max, exp.Distinct, exp.Lower, exp.Upper,
+        exp.Group, exp.Having, exp.Order, exp.Ordered, exp.Where,
+    )
+
+
+def _runs_locally(nodes: List[Any]) -> bool:
+    # anything else (casts, dates, string and math functions, integer
+    # division...) may answer differently in SQLite, so it goes to the database
+    allowed = _local_nodes()
+    return all(isinstance(n, allowed) for node in nodes if node is not None for n in node.walk())
+
+
+def _output_name(item: Any) -> str:
+    """The column name Postgres gives a select item."""
+    from sqlglot import exp
+
+    if isinstance(item, exp.Alias):
+        return item.alias
+    if isinstance(item, exp.Column):
+        return item.name
+    if isinstance(item, (exp.Count, exp.Sum, exp.Avg, exp.Min, exp.Max, exp.Lower, exp.Upper)):
+        return item.key
+    return "?column?"
+
+
+@lru_cache(maxsize=256)
+def _like_regex(pattern: str, escape: str = "\\") -> "re.Pattern[str]":
+    out, chars = [], iter(pattern)
+    for ch in chars:
+        if ch == escape:
+            out.append(re.escape(next(chars, "")))
+        elif ch == "%":
+            out.append(".*")
+        elif ch == "_":
+            out.append(".")
+        else:
+            out.append(re.escape(ch))
+    return re.compile("".join(out), re.DOTALL)
+
+
+def _pg_like(pattern: Optional[str], value: Any, escape: str = "\\") -> Optional[bool]:
+    # Postgres LIKE: case-sensitive, backslash escapes by default
+    if pattern is None or value is None:
+        return None
+    return _like_regex(str(pattern), escape).fullmatch(str(value)) is not None
+
+
+def _pg_case(method: str):
+    # SQLite's own lower()/upper() only fold ASCII; ILIKE compiles to LOWER(..) LIKE LOWER(..)
+    return lambda value: getattr(value, method)() if isinstance(value, str) else value
+
+
+def _connect() -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:", check_same_thread=False)
+    db.create_function("like", 2, _pg_like, deterministic=True)
+    db.create_function("like", 3, _pg_like, deterministic=True)
+    db.create_function("lower", 1, _pg_case("lower"), deterministic=True)
+    db.create_function("upper", 1, _pg_case("upper"), deterministic=True)
+    return db
+
+
+def _limit_value(select: Any) -> Optional[int]:
+    limit = select.args.get("limit")
+    if limit is None:
+        return None
+    try:
+        return int(limit.expression.name)
+    except (AttributeError, TypeError, ValueError):
+        return -1  # non-literal limit: completeness is unknown
+
+
+def _output_columns(select: Any) -> Tuple[Dict[Tuple[str, str], str], Dict[str, Optional[str]]]:
+    """Projection of the cached query: (table, column) -> output name, and column -> output name."""
+    from sqlglot import exp
+
+    qualified: Dict[Tuple[str, str], str] = {}
+    by_name: Dict[str, Optional[str]] = {}
+    for item in select.expressions:
+        source = item.this if isinstance(item, exp.Alias) else item
+        if not isinstance(source, exp.Column):
+            continue
+        qualified[(source.table, source.name)] = item.alias_or_name
+        # an ambiguous bare name maps to None and cannot be resolved
+        by_name[source.name] = None if source.name in by_name else item.alias_or_name
+    return qualified, by_name
+
+
+def plan_local_query(sql: str, frame_sql: str, row_count: int) -> Optional[str]:
+    """SQLite query answering `sql` from the rows of `frame_sql`, or None if the frame can't.
+
+    Two shapes are recognised, both on the same FROM/JOIN clause and with a
+    WHERE that keeps every condition of the cached query:
+
+    * the cached query is a plain projection: the new one may filter further,
+      aggregate, sort and limit, as long as it only reads projected columns;
+    * the cached query aggregates: the new one repeats its projection, GROUP BY
+      and HAVING and only adds conditions on projected group keys.
+
+    A cached query whose LIMIT was reached is incomplete and never used, and
+    only expressions SQLite evaluates the way Postgres does are planned.
+    """
+    import sqlglot
+    from sqlglot import exp
+
+    try:
+        new = sqlglot.parse_one(sql, dialect="postgres")
+        old = sqlglot.parse_one(frame_sql, dialect="postgres")
+    except Exception:
+        return None
+    if not isinstance(new, exp.Select) or not isinstance(old, exp.Select):
+        return None
+    for q in (new, old):
+        if _arg(q, "with") or q.args.get("offset") or q.find(exp.Subquery, exp.Window):
+            return None
+    if _canon(_arg(new, "from")) != _canon(_arg(old, "from")):
+        return None
+    if [_canon(j) for j in new.args.get("joins") or []] != [_canon(j) for j in old.args.get("joins") or []]:
+        return None
+    old_limit = _limit_value(old)
+    if old_limit is not None and (old_limit < 0 or row_count >= old_limit):
+        return None
+
+    old_conds = {_canon(c) for c in _conjuncts(old.args.get("where"))}
+    new_conds = _conjuncts(new.args.get("where"))
+    if not old_conds <= {_canon(c) for c in new_conds}:
+        return None
+    extra = [c.copy() for c in new_conds if _canon(c) not in old_conds]
+    if not _runs_locally([*new.expressions, *extra, new.args.get("group"), new.args.get("having"),
+                          new.args.get("order")]):
+        return None
+
+    qualified, by_name = _output_columns(old)
+    new_aliases = {item.alias for item in new.expressions if isinstance(item, exp.Alias)}
+
+    def resolve(column: Any) -> Optional[str]:
+        name = qualified.get((column.table, column.name))
+        return name if name is not None else by_name.get(column.name)
+
+    def to_frame_columns(node: Any, allowed: Optional[set] = None,
+                         alias_first: Optional[bool] = None) -> Optional[Any]:
+        """Rewrite columns to frame columns; None when one isn't a plain column of the cached query.
+
+        `alias_first` lets bare names refer to the new query's own output
+        aliases: ahead of input columns (ORDER BY) or only when no input
+        column matches (GROUP BY). Elsewhere an unresolved name is refused,
+        even if the new query aliases something to it.
+        """
+        for column in list(node.find_all(exp.Column)):
+            is_alias = alias_first is not None and not column.table and column.name in new_aliases
+            if is_alias and alias_first:
+                continue
+            target = resolve(column)
+            if target is None or (allowed is not None and target not in allowed):
+                if not is_alias:
+                    return None
+                continue
+            replacement = exp.column(target, quoted=True)
+            if column.parent is None:
+                return replacement
+            column.replace(replacement)
+        return node
+
+    aggregated = bool(old.args.get("group")) or old.find(exp.AggFunc) is not None
+    if aggregated:
+        same_shape = (
+            [_canon(e) for e in new.expressions] == [_canon(e) for e in old.expressions]
+            and _canon(new.args.get("group")) == _canon(old.args.get("group"))
+            and _canon(new.args.get("having")) == _canon(old.args.get("having"))
+            and bool(new.args.get("distinct")) == bool(old.args.get("distinct"))
+        )
+        if not same_shape:
+            return None
+        group_keys = {
+            qualified.get((g.table, g.name)) or by_name.get(g.name)
+            for g in old.args["group"].expressions if isinstance(g, exp.Column)
+        } if old.args.get("group") else set()
+        group_keys.discard(None)
+        # projection items are columns of the frame by their output name
+        outputs = {_canon(item.this if isinstance(item, exp.Alias) else item): _output_name(item)
+                   for item in old.expressions}
+        local = exp.select(*[exp.column(_output_name(item), quoted=True) for item in old.expressions])
+        local = local.from_(FRAME_TABLE)
+        for cond in extra:
+            cond = to_frame_columns(cond, allowed=group_keys)
+            if cond is None:
+                return None
+            local = local.where(cond)
+        order = new.args.get("order")
+        if order is not None:
+            ordered = []
+            for item in order.expressions:
+                key = _canon(item.this)
+                name = outputs.get(key) or (item.this.name if item.this.name in outputs.values() else None)
+                if name is None:
+                    return None
+                ordered.append(exp.Ordered(this=exp.column(name, quoted=True), desc=item.args.get("desc")))
+            local = local.order_by(*ordered)
+    else:
+        if old.args.get("distinct"):
+            return None
+        local = new.copy()
+        local.set("joins", None)
+        local.set("where", None)
+        local = local.from_(FRAME_TABLE, copy=False)
+        # keep the output names the database would have returned
+        local.set("expressions", [
+            e if isinstance(e, (exp.Alias, exp.Star)) else exp.alias_(e, _output_name(e), quoted=True)
+            for e in local.expressions
+        ])
+        alias_first = {"group": False, "order": True}
+        for key in ("expressions", "group", "having", "order"):
+            value = local.args.get(key)
+            nodes = value if isinstance(value, list) else [value] if value is not None else []
+            for node in nodes:
+                if to_frame_columns(node, alias_first=alias_first.get(key)) is None:
+                    return None
+        for cond in extra:
+            cond = to_frame_columns(cond)
+            if cond is None:
+                return None
+            local = local.where(cond)
+
+    if new.args.get("limit") is not None:
+        local.set("limit", new.args["limit"].copy())
+    try:
+        return local.sql(dialect="sqlite")
+    except Exception:
+        return None
+
+
+# postgres types sql-mcp reports for numeric result columns
+NUMERIC_TYPES = {"int2", "int4", "int8", "float4", "float8", "numeric", "money"}
+
+
+def _column_types(exec_result: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    columns = exec_result.get("columns")
+    if not isinstance(columns, list) or not columns:
+        return None
+    return {str(c.get("name")): str(c.get("type")) for c in columns if isinstance(c, dict)}
+
+
+def _numeric_columns(df: pd.DataFrame, types: Dict[str, str]) -> pd.DataFrame:
+    # decimals arrive as strings; SQLite would then compare them as text. Only
+    # columns the database typed as numeric are converted: text that looks
+    # numeric (zero-padded codes, IDs) stays text.
+    for col in df.columns:
+        values = df[col]
+        if types.get(str(col)) not in NUMERIC_TYPES:
+            continue
+        if values.dtype != object and not pd.api.types.is_string_dtype(values.dtype):
+            continue
+        df[col] = pd.to_numeric(values, errors="coerce")
+    return df
+
+
+@dataclass
+class Frame:
+    """One cached exec_result: the SQL that produced it and its rows as a DataFrame."""
+
+    sql: str
+    df: pd.DataFrame
+    nbytes: int
+    _db: Optional[sqlite3.Connection] = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def query(self, local_sql: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._db is None:
+                db = _connect()
+                self.df.to_sql(FRAME_TABLE, db, index=False)
+                self._db = db
+            cur = self._db.execute(local_sql)
+            columns = [d[0] for d in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class ResultStore:
+    """Bounded per-session LRU of recent query results for drill-down follow-ups.
+
+    A follow-up whose SQL only narrows a cached query (see plan_local_query)
+    is answered by SQLite in memory over the cached rows instead of another
+    database round trip. Sessions, frames per session and total bytes are
+    all capped; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, frames_per_session: int = 4, max_sessions: int = 1000,
+                 max_bytes: int = 256 * 1024 * 1024, max_rows: int = 50000):
+        self.frames_per_session = frames_per_session
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._sessions: "OrderedDict[str, OrderedDict[str, Frame]]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls) -> "ResultStore":
+        cfg = get_config()
+        return cls(
+            frames_per_session=cfg.result_store_frames_per_session,
+            max_sessions=cfg.result_store_max_sessions,
+            max_bytes=cfg.result_store_max_bytes,
+            max_rows=cfg.result_store_max_rows,
+        )
+
+    def frames(self) -> int:
+        return sum(len(frames) for frames in self._sessions.values())
+
+    def _drop(self, frame: Frame) -> None:
+        self.nbytes -= frame.nbytes
+        frame.close()
+
+    def _evict(self) -> None:
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.nbytes > self.max_bytes):
+            session_id, frames = next(iter(self._sessions.items()))
+            if frames:
+                self._drop(frames.popitem(last=False)[1])
+            if not frames:
+                del self._sessions[session_id]
+
+    def _make_frame(self, sql: str, rows: List[Dict[str, Any]], types: Dict[str, str]) -> Frame:
+        df = _numeric_columns(pd.DataFrame(rows), types)
+        # the SQLite copy is built on first use; count it up front
+        return Frame(sql=sql, df=df, nbytes=2 * int(df.memory_usage(deep=True).sum()))
+
+    async def put(self, session_id: str, sql: Optional[str], exec_result: Optional[Dict[str, Any]]) -> None:
+        if not session_id or not sql or not isinstance(exec_result, dict) or not exec_result.get("success"):
+            return
+        # a fetch cut short can't answer drill-downs over the full query
+        if exec_result.get("truncated"):
+            return
+        rows = exec_result.get("data")
+        # without column types numeric text can't be told from real text
+        types = _column_types(exec_result)
+        if not isinstance(rows, list) or not rows or len(rows) > self.max_rows or types is None:
+            return
+        frames = self._sessions.get(session_id)
+        if frames is not None and sql in frames:
+            frames.move_to_end(sql)
+            self._sessions.move_to_end(session_id)
+            return
+        frame = await asyncio.to_thread(self._make_frame, sql, rows, types)
+        if frame.nbytes > self.max_bytes:
+            return
+        frames = self._sessions.setdefault(session_id, OrderedDict())
+        self._sessions.move_to_end(session_id)
+        old = frames.pop(sql, None)
+        if old is not None:
+            self._drop(old)
+        frames[sql] = frame
+        self.nbytes += frame.nbytes
+        while len(frames) > self.frames_per_session:
+            self._drop(frames.popitem(last=False)[1])
+        self._evict()
+
+    def clear(self, session_id: str) -> None:
+        for frame in (self._sessions.pop(session_id, None) or {}).values():
+            self._drop(frame)
+
+    async def answer(self, session_id: Optional[str], sql: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """(exec_result, source SQL) computed from a cached frame, or None."""
+        frames = self._sessions.get(session_id or "")
+        if not frames:
+            return None
+        # newest first: the latest result is the likeliest drill-down base
+        for frame_sql, frame in reversed(list(frames.items())):
+            local_sql = plan_local_query(sql, frame_sql, len(frame.df))
+            if local_sql is None:
+                continue
+            try:
+                rows = await asyncio.to_thread(frame.query, local_sql)
+            except Exception:
+                continue
+            self._sessions.move_to_end(session_id)
+            frames.move_to_end(frame_sql)
+            self.hits += 1
+            return {"success": True, "data": rows, "row_count": len(rows)}, frame_sql
+        self.misses += 1
+        return None
+
+
+result_store = ResultStore.from_config()
+register_gauge("bigpt_result_store_frames", result_store.frames)
+register_gauge("bigpt_result_store_bytes", lambda: result_store.nbytes)
+register_gauge("bigpt_result_store_hits_total", lambda: result_store.hits)
+register_gauge("bigpt_result_store_misses_total", lambda: result_store.misses)
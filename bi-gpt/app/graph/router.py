@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import math
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# ---------- SEED DATA ----------
+
+# Stems / phrases that almost always mean "go to the database".
+# Keywords match whole words; a trailing "*" marks a stem that takes any ending.
+DATA_KEYWORDS = [
+    # RU
+    "сколько", "количеств*", "средн*", "сумм*", "оборот*", "баланс*", "транзакц*",
+    "перевод*", "клиент*", "категори*", "статус*", "город*", "выручк*", "трат*",
+    "распределени*", "динамик*", "по месяц*", "по дням", "топ", "максимал*",
+    "минимал*", "доля", "доли", "процент*", "покажи", "выведи", "посчитай", "график*",
+    "за период", "за месяц*", "за год",
+    # EN
+    "how many", "average", "avg", "total", "sum of", "count", "number of",
+    "revenue", "turnover", "balance*", "transaction*", "transfer*", "client*",
+    "customer*", "categor*", "top", "per month", "per day", "by city",
+    "distribution", "breakdown", "trend*", "show me", "list the", "chart*",
+]
+
+# Phrases that almost always mean "small talk".
+CHITCHAT_KEYWORDS = [
+    # RU
+    "привет*", "здравствуй*", "добрый день", "добрый вечер", "как дела",
+    "спасибо", "благодарю", "кто ты", "что ты умеешь", "пока", "до свидания",
+    "расскажи анекдот", "шутк*",
+    # EN
+    "hello", "hi", "hey", "how are you", "thank*", "who are you",
+    "what can you do", "bye", "good morning", "good evening", "joke*",
+]
+
+
+def _keyword_pattern(keywords: Iterable[str], stems: bool = True) -> Optional["re.Pattern[str]"]:
+    """One regex matching any of `keywords` on word boundaries (None for no keywords)."""
+    parts = [
+        re.escape(k[:-1]) + r"\w*" if stems and k.endswith("*") else re.escape(k)
+        for k in sorted(keywords, key=len, reverse=True)
+    ]
+    if not parts:
+        return None
+    return re.compile(r"(?<!\w)(?:" + "|".join(parts) + r")(?!\w)")
+
+
+def _hits(pattern: Optional["re.Pattern[str]"], text: str) -> int:
+    """Number of distinct keywords found in `text`."""
+    return len(set(pattern.findall(text))) if pattern is not None else 0
+
+
+_DATA_RE = _keyword_pattern(DATA_KEYWORDS)
+_CHITCHAT_RE = _keyword_pattern(CHITCHAT_KEYWORDS)
+
+SEED_EXAMPLES: List[Tuple[str, int]] = [
+    ("сколько клиентов в каждом городе", 1),
+    ("средний баланс премиальных клиентов", 1),
+    ("общий оборот по категориям за последний месяц", 1),
+    ("покажи топ 10 категорий трат", 1),
+    ("количество переводов по типам", 1),
+    ("динамика транзакций по дням", 1),
+    ("распределение клиентов по возрасту", 1),
+    ("какая доля входящих переводов", 1),
+    ("сумма транзакций в алматы", 1),
+    ("средний чек по категориям", 1),
+    ("how many clients are in each city", 1),
+    ("average transaction amount by category", 1),
+    ("total turnover per month", 1),
+    ("show top 5 spending categories", 1),
+    ("number of transfers by direction", 1),
+    ("monthly trend of transactions", 1),
+    ("distribution of client balances", 1),
+    ("sum of transfers in astana", 1),
+    ("привет", 0),
+    ("привет, как дела?", 0),
+    ("спасибо за помощь", 0),
+    ("кто ты такой", 0),
+    ("что ты умеешь делать", 0),
+    ("расскажи шутку", 0),
+    ("добрый день", 0),
+    ("пока, до свидания", 0),
+    ("как тебя зовут", 0),
+    ("hello there", 0),
+    ("hi, how are you", 0),
+    ("thanks a lot", 0),
+    ("who are you", 0),
+    ("what can you do", 0),
+    ("tell me a joke", 0),
+    ("good morning", 0),
+    ("bye", 0),
+    ("what is your name", 0),
+]
+
+
+# ---------- FEATURES ----------
+
+_N_FEATURES = 1 << 14
+_NGRAM_RANGE = (2, 4)
+_WS_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    text = (text or "").lower().replace("ё", "е")
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Hashed character n-grams with word-boundary padding, L2-normalised."""
+    padded = f" {text} "
+    feats: Dict[int, float] = {}
+    lo, hi = _NGRAM_RANGE
+    for n in range(lo, hi + 1):
+        for i in range(len(padded) - n + 1):
+            idx = zlib.crc32(padded[i:i + n].encode("utf-8")) % _N_FEATURES
+            feats[idx] = feats.get(idx, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in feats.values())) or 1.0
+    return {k: v / norm for k, v in feats.items()}
+
+
+def _sigmoid(z: float) -> float:
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def current_question(user_input: str) -> str:
+    """Strip the memory prefix added by /chat and keep only the current question."""
+    marker = "Current question:"
+    if marker in user_input:
+        return user_input.rsplit(marker, 1)[1].strip()
+    return user_input.strip()
+
+
+# ---------- ROUTER ----------
+
+class FastRouter:
+    """Local sql_query/other classifier.
+
+    Combines keyword/vocabulary matches with a logistic regression over hashed
+    character n-grams. `predict` returns the route only when confident enough,
+    otherwise None so the caller can fall back to the LLM classifier.
+    """
+
+    def __init__(self, threshold: float = 0.85, epochs: int = 40, lr: float = 0.5):
+        self.threshold = threshold
+        self.weights: Dict[int, float] = {}
+        self.bias = 0.0
+        self.vocabulary: set = set()
+        self._vocabulary_re: Optional["re.Pattern[str]"] = None
+        self._train(SEED_EXAMPLES, epochs=epochs, lr=lr)
+
+    def _train(self, examples: List[Tuple[str, int]], epochs: int, lr: float) -> None:
+        data = [(_features(_normalize(t)), y) for t, y in examples]
+        for _ in range(epochs):
+            for x, y in data:
+                err = self._score(x) - y
+                self.bias -= lr * err
+                for k, v in x.items():
+                    self.weights[k] = self.weights.get(k, 0.0) - lr * err * v
+
+    def _score(self, x: Dict[int, float]) -> float:
+        z = self.bias + sum(self.weights.get(k, 0.0) * v for k, v in x.items())
+        return _sigmoid(z)
+
+    def add_terms(self, terms: Iterable[str]) -> None:
+        for t in terms:
+            t = _normalize(str(t or ""))
+            if len(t) >= 3 and t not in self.vocabulary:
+                self.vocabulary.add(t)
+                self._vocabulary_re = None
+
+    def learn_schema(self, metainfo: Optional[Dict[str, Any]], policies: Optional[Dict[str, Any]]) -> None:
+        """Pick up table/column names, enum values and glossary terms."""
+        terms: List[str] = []
+        if metainfo:
+            for table in metainfo.get("tables") or []:
+                terms.append(table.get("tablename", ""))
+            for enum in metainfo.get("enumerables") or []:
+                for row in enum.get("values") or []:
+                    terms.extend(row.values() if isinstance(row, dict) else [row])
+        if policies:
+            policies = policies.get("policies", policies)
+            terms.extend(policies.get("allow_tables") or [])
+            terms.extend((policies.get("glossary") or {}).keys())
+        self.add_terms(terms)
+
+    def _keyword_votes(self, text: str) -> Tuple[int, int]:
+        if self._vocabulary_re is None and self.vocabulary:
+            self._vocabulary_re = _keyword_pattern(self.vocabulary, stems=False)
+        data_hits = _hits(_DATA_RE, text) + _hits(self._vocabulary_re, text)
+        return data_hits, _hits(_CHITCHAT_RE, text)
+
+    def score(self, user_input: str) -> float:
+        """Probability that the message is a data question."""
+        text = _normalize(current_question(user_input))
+        if not text:
+            return 0.0
+        p = self._score(_features(text))
+        data_hits, chat_hits = self._keyword_votes(text)
+        z = math.log(max(p, 1e-6) / max(1 - p, 1e-6)) + 2.0 * data_hits - 2.0 * chat_hits
+        return _sigmoid(z)
+
+    def predict(self, user_input: str, context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], float]:
+        """Route and confidence; the route is None when the LLM classifier should decide.
+
+        `context` is the session's conversation context. After a data turn a
+        short message ("а за прошлую неделю?") is usually a follow-up query
+        the n-grams can't tell from small talk, so only "sql_query" is
+        decided locally then.
+        """
+        p = self.score(user_input)
+        route = "sql_query" if p >= 0.5 else "other"
+        confidence = max(p, 1.0 - p)
+        if confidence < self.threshold or (route == "other" and (context or {}).get("facts")):
+            return None, confidence
+        return route, confidence
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+def _structured(result: Any) -> Dict[str, Any]:
+    return getattr(result, "structured_content", None) or {"raw": str(result)}
+
+
+class SchemaCache:
+    """Caches sql-mcp metainfo and policies for `ttl_seconds`.
+
+    Concurrent callers share a single refresh.
+    """
+
+    def __init__(self, t_meta, t_policies, ttl_seconds: float = 300.0):
+        self.t_meta = t_meta
+        self.t_policies = t_policies
+        self.ttl_seconds = ttl_seconds
+        self._value: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._value is not None and time.monotonic() - self._fetched_at < self.ttl_seconds
+
+    async def refresh(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        metainfo, policies = await asyncio.gather(self.t_meta._arun(), self.t_policies._arun())
+        self._value = (_structured(metainfo), _structured(policies))
+        self._fetched_at = time.monotonic()
+        return self._value
+
+    async def get(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if self._fresh():
+            return self._value
+        async with self._lock:
+            if self._fresh():
+                return self._value
+            return await self.refresh()
+
+    def invalidate(self) -> None:
+        self._value = None
@@ -1,11 +1,19 @@
-from typing import Optional, List, Literal, TypedDict, Any, Dict
+import operator
+from typing import Optional, List, Literal, TypedDict, Any, Dict, Annotated
 
 class GraphState(TypedDict, total=False):
     user_input: str
+    session_id: Optional[str]
+    # rolling summary and last-query facts; nodes take only their slice (app/conversation.py)
+    conversation: Dict[str, Any]
     context: Dict[str, Any]
     route: Optional[Literal["sql_query", "other"]]
     sql: Optional[str]
+    sql_candidates: List[str]
+    metainfo: Optional[Dict[str, Any]]
+    policies: Optional[Dict[str, Any]]
     exec_result: Optional[Dict[str, Any]]
-    intermediate_steps: List[Dict[str, Any]]
+    # analyse and visualize run in the same step, so steps are merged by concatenation
+    intermediate_steps: Annotated[List[Dict[str, Any]], operator.add]
     final_text: Optional[str]
     visualization: Optional[Dict[str, Any]]
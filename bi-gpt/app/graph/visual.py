@@ -1,81 +1,210 @@
-import math, random, datetime
+import math, random, datetime, re
 from typing import List, Dict, Any, Optional
 import pandas as pd
 import numpy as np
 
+from app.config import get_config
+
 def _serialize_value(v):
     """Convert pandas/np types to plain Python types suitable for JSON/display."""
     if pd.isna(v):
         return None
+    # numpy bool etc.; checked before int since bool is an int subclass
+    if isinstance(v, (np.bool_, bool)):
+        return bool(v)
     if isinstance(v, (np.floating, float)):
         return float(v)
     if isinstance(v, (np.integer, int)):
         return int(v)
     if isinstance(v, (pd.Timestamp, datetime.datetime)):
         return v.isoformat()
-    # numpy bool etc.
-    if isinstance(v, (np.bool_, bool)):
-        return bool(v)
     return v
 
-def _clean_numeric_data(data: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
-    """Clean numeric data that might contain concatenated numbers separated by dots."""
-    cleaned_data = []
-    for row in data:
-        cleaned_row = {}
-        for key, value in row.items():
-            if isinstance(value, str) and value.replace('.', '').replace('-', '').isdigit():
-                if value.count('.') > 1 and len(value) > 20:
-                    try:
-                        parts = value.split('.')
-                        if parts[0]:
-                            cleaned_value = float(parts[0])
-                        else:
-                            cleaned_value = float(''.join(parts))
-                    except (ValueError, IndexError):
-                        try:
-                            cleaned_value = float(value)
-                        except ValueError:
-                            cleaned_value = 0.0
-                else:
-                    try:
-                        cleaned_value = float(value)
-                    except ValueError:
-                        cleaned_value = 0.0
-                cleaned_row[key] = cleaned_value
-            else:
-                cleaned_row[key] = value
-        cleaned_data.append(cleaned_row)
-    return cleaned_data
-
-def _records_serializable(df: pd.DataFrame) -> List[Dict[str,Any]]:
-    recs = df.to_dict(orient='records')
-    return [{k: _serialize_value(v) for k,v in r.items()} for r in recs]
-
-def make_histogram_payload(data: List[Dict[str,Any]], x_field: str="x", bins:int=10, title:Optional[str]=None):
+# digits and dots with an optional leading minus; "2025-01-31" is a date, not a number
+_NUMERIC_TEXT_RE = re.compile(r"-?[0-9.]*[0-9][0-9.]*")
+
+def _parse_numeric_text(v: str) -> float:
+    # concatenated numbers ("1.2.3...", over 20 chars) keep their head
+    if v.count(".") > 1 and len(v) > 20:
+        v = v.split(".", 1)[0] or v.replace(".", "")
+    try:
+        return float(v)
+    except ValueError:
+        return 0.0
+
+def _clean_numeric_column(s: pd.Series) -> pd.Series:
+    """Numbers sent as text become floats, everything else is kept."""
+    # each distinct value is checked once; result columns repeat values a lot
+    try:
+        codes, uniques = pd.factorize(s)
+    except TypeError:  # unhashable cells (JSON arrays/objects) are left as they are
+        return s
+    uniques = np.asarray(uniques, dtype=object)
+    match = _NUMERIC_TEXT_RE.fullmatch
+    hit = np.fromiter((isinstance(u, str) and match(u) is not None for u in uniques), dtype=bool, count=len(uniques))
+    if not hit.any():
+        return s
+    texts = uniques[hit]
+    try:
+        parsed = texts.astype(float)
+    except ValueError:  # some are malformed ("1.2.3"); only those take the slow path
+        parsed = pd.to_numeric(texts, errors="coerce").astype(float)
+    for i in np.flatnonzero(np.isnan(parsed)):
+        parsed[i] = _parse_numeric_text(texts[i])
+    present = codes >= 0
+    if hit.all():
+        values = np.full(len(s), np.nan)
+        values[present] = parsed[codes[present]]
+        return pd.Series(values, index=s.index, name=s.name)
+    uniques[hit] = parsed
+    values = s.to_numpy(dtype=object, copy=True)
+    values[present] = uniques[codes[present]]
+    return pd.Series(values, index=s.index, name=s.name).infer_objects()
+
+def prepare_frame(data) -> pd.DataFrame:
+    """The one typed DataFrame every chart step works on: built once, numeric text coerced column-wise."""
+    if isinstance(data, pd.DataFrame):
+        return data
     df = pd.DataFrame(data)
+    for col in df.columns:
+        # object, or the dedicated string dtype of newer pandas
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = _clean_numeric_column(df[col])
+    return df
+
+def _column_values(s: pd.Series) -> List[Any]:
+    """A whole column as JSON-ready Python values: NaN/NaT -> None, timestamps -> ISO strings."""
+    dtype = s.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype) and getattr(dtype, "tz", None) is None:
+        ts = s.to_numpy(dtype="datetime64[ns]")
+        nat = np.isnat(ts)
+        # whole seconds print like Timestamp.isoformat(); finer ones go value by value
+        if (ts[~nat].view(np.int64) % 1_000_000_000 == 0).all():
+            values = np.datetime_as_string(ts, unit="s").astype(object)
+            values[nat] = None
+            return values.tolist()
+    elif isinstance(dtype, np.dtype) and dtype.kind == "f":
+        values = s.to_numpy().astype(object)
+        values[np.isnan(s.to_numpy())] = None
+        return values.tolist()
+    elif isinstance(dtype, np.dtype) and dtype.kind in "iub":
+        return s.to_numpy().tolist()
+    elif pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+        return s.astype(object).where(s.notna(), None).tolist()
+    return [_serialize_value(v) for v in s.to_numpy(dtype=object)]
+
+def serialize_columns(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    """{"column": [values...]} with every value JSON-ready, converted a column at a time."""
+    return {str(col): _column_values(df[col]) for col in df.columns}
+
+def _chart_data(df: pd.DataFrame, columnar: bool = False):
+    """Payload rows, or {"column": [...]} when `columnar` (the compact response format)."""
+    columns = serialize_columns(df)
+    if columnar:
+        return columns
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+def _payload(chart_type: str, meta: Dict[str, Any], df: pd.DataFrame, columnar: bool = False) -> Dict[str, Any]:
+    payload = {"chart_type": chart_type, "meta": meta, "data": _chart_data(df, columnar)}
+    if columnar:
+        payload["data_format"] = "columnar"
+    return payload
+
+def _as_axis(s: pd.Series) -> np.ndarray:
+    """Float positions of line x values: numbers as is, datetimes as ns, anything else by rank."""
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype=float)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    return np.arange(len(s), dtype=float)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the shape of a sorted series."""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.linspace(0, n - 1, max(n_out, 1)).astype(int)
+    # first and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # the next bucket's mean is the third triangle corner (the last point for the last bucket)
+        nxt_end = edges[i + 2] if i + 2 < len(edges) else n
+        nxt_start = end if i + 2 < len(edges) else n - 1
+        cx, cy = x[nxt_start:nxt_end].mean(), y[nxt_start:nxt_end].mean()
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[prev] - cx) * (by - y[prev]) - (x[prev] - bx) * (cy - y[prev]))
+        prev = start + int(area.argmax())
+        out[i + 1] = prev
+    return out
+
+def grid_sample_indices(x: np.ndarray, y: np.ndarray, n_out: int, seed: int = 0) -> np.ndarray:
+    """Sorted indices of exactly `n_out` points (all of them if fewer), sampled per cell of a 2D grid.
+
+    Each occupied cell keeps one point, so outliers stay visible; the rest of
+    the budget is split in proportion to the cells' remaining points, with
+    largest remainders rounding up, so dense regions stay dense.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    # at most half the budget goes to the one-point-per-cell minimum
+    side = max(1, int(math.sqrt(n_out / 2)))
+
+    def cell_of(v: np.ndarray) -> np.ndarray:
+        lo, span = v.min(), v.max() - v.min()
+        if span == 0:
+            return np.zeros(len(v), dtype=np.int64)
+        return np.minimum(((v - lo) / span * side).astype(np.int64), side - 1)
+
+    cells = cell_of(x) * side + cell_of(y)
+    counts = np.bincount(cells, minlength=side * side)
+    occupied = counts > 0
+    spare = np.where(occupied, counts - 1, 0)
+    budget = n_out - int(occupied.sum())
+    share = budget * spare
+    quota = occupied.astype(np.int64) + share // spare.sum()
+    left = n_out - int(quota.sum())
+    if left > 0:
+        # cells with the largest fractional share take the points floor division dropped
+        quota[np.argsort(-(share % spare.sum()), kind="stable")[:left]] += 1
+    # a seeded shuffle makes the sample random within a cell but stable across runs
+    order = np.random.default_rng(seed).permutation(n)
+    order = order[np.argsort(cells[order], kind="stable")]
+    starts = np.concatenate(([0], np.cumsum(counts)))[cells[order]]
+    rank = np.arange(n) - starts
+    keep = order[rank < quota[cells[order]]]
+    return np.sort(keep)
+
+def make_histogram_payload(data: List[Dict[str,Any]], x_field: str="x", bins:int=10, title:Optional[str]=None, columnar: bool=False):
+    df = prepare_frame(data)
     if x_field not in df.columns:
         raise ValueError(f"x_field '{x_field}' not found")
     x = pd.to_numeric(df[x_field], errors="coerce").dropna().astype(float)
     counts, edges = np.histogram(x.values, bins=bins)
+    return histogram_payload(counts, edges, x_field=x_field, title=title, columnar=columnar)
+
+def histogram_payload(counts: np.ndarray, edges: np.ndarray, x_field: str, title: Optional[str]=None, columnar: bool=False):
+    """Histogram payload from bin counts and the bins+1 edges, however they were counted."""
+    counts = np.asarray(counts, dtype=np.int64)
     total = int(counts.sum())
-    out = []
-    for i in range(len(counts)):
-        out.append({
-            "bin_start": float(edges[i]),
-            "bin_end": float(edges[i+1]),
-            "count": int(counts[i]),
-            "pct": float(counts[i]) / total if total>0 else 0.0
-        })
+    out_df = pd.DataFrame({
+        "bin_start": edges[:-1],
+        "bin_end": edges[1:],
+        "count": counts,
+        "pct": counts / total if total>0 else 0.0,
+    })
     meta = {"title": title or f"Histogram of {x_field}", "x_label": x_field, "y_label": "count",
             "tooltip_fields": ["bin_start","bin_end","count","pct"]}
-    for row in out:
-        for k in list(row.keys()):
-            row[k] = _serialize_value(row[k])
-    return {"chart_type":"histogram","meta":meta,"data":out}
+    return _payload("histogram", meta, out_df, columnar)
 
-def make_pie_payload(data: List[Dict[str,Any]], group_by: str, y_field: Optional[str]=None, aggregate: str="sum", title:Optional[str]=None):
-    df = pd.DataFrame(data)
+def make_pie_payload(data: List[Dict[str,Any]], group_by: str, y_field: Optional[str]=None, aggregate: str="sum", title:Optional[str]=None, columnar: bool=False):
+    df = prepare_frame(data)
     if group_by not in df.columns:
         raise ValueError(f"group_by '{group_by}' not found")
     if y_field and y_field in df.columns and aggregate != "count":
@@ -87,17 +216,17 @@ def make_pie_payload(data: List[Dict[str,Any]], group_by: str, y_field: Optional
         grouped = df.groupby(group_by).size().rename("value")
     grouped = grouped.sort_values(ascending=False)
     total = float(grouped.sum()) if grouped.sum() is not None else 0.0
-    out = []
-    for n,v in grouped.items():
-        out.append({"name": str(n), "value": float(v), "pct": (float(v)/total if total>0 else 0.0)})
-    for row in out:
-        for k in list(row.keys()):
-            row[k] = _serialize_value(row[k])
+    values = grouped.to_numpy(dtype=float)
+    out_df = pd.DataFrame({
+        "name": grouped.index.map(str),
+        "value": values,
+        "pct": values / total if total>0 else 0.0,
+    })
     meta = {"title": title or f"Pie: {group_by}", "tooltip_fields":["name","value","pct"]}
-    return {"chart_type":"pie","meta":meta,"data":out}
+    return _payload("pie", meta, out_df, columnar)
 
-def make_scatter_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: str="y", extra_fields: Optional[List[str]]=None, title:Optional[str]=None):
-    df = pd.DataFrame(data)
+def make_scatter_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: str="y", extra_fields: Optional[List[str]]=None, title:Optional[str]=None, max_points: Optional[int]=None, columnar: bool=False):
+    df = prepare_frame(data)
     if x_field not in df.columns or y_field not in df.columns:
         raise ValueError("scatter requires x_field and y_field present")
     x = pd.to_numeric(df[x_field], errors="coerce")
@@ -108,17 +237,20 @@ def make_scatter_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: s
             if f in df.columns:
                 out_df[f] = df[f]
     out_df = out_df.dropna(subset=["x","y"]).reset_index(drop=True)
-    data_out = _records_serializable(out_df)
     meta = {"title": title or f"Scatter {y_field} vs {x_field}", "x_label": x_field, "y_label": y_field,
             "tooltip_fields": ["x","y"] + (extra_fields or [])}
-    return {"chart_type":"scatter","meta":meta,"data":data_out}
+    if max_points and len(out_df) > max_points:
+        keep = grid_sample_indices(out_df["x"].to_numpy(dtype=float), out_df["y"].to_numpy(dtype=float), max_points)
+        meta.update(original_points=len(out_df), downsampling="grid_sample")
+        out_df = out_df.iloc[keep]
+    return _payload("scatter", meta, out_df, columnar)
 
-def make_line_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: str="y", aggregate: str="sum", time_freq: Optional[str]=None, title:Optional[str]=None):
-    df = pd.DataFrame(data)
+def make_line_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: str="y", aggregate: str="sum", time_freq: Optional[str]=None, title:Optional[str]=None, max_points: Optional[int]=None, columnar: bool=False):
+    df = prepare_frame(data)
     if x_field not in df.columns or y_field not in df.columns:
         raise ValueError("line requires x_field and y_field present")
     if time_freq:
-        tmp = df.copy()
+        tmp = df[[x_field, y_field]].copy()
         tmp[x_field] = pd.to_datetime(tmp[x_field], errors="coerce")
         tmp[y_field] = pd.to_numeric(tmp[y_field], errors="coerce").fillna(0.0)
         tmp = tmp.dropna(subset=[x_field])
@@ -138,23 +270,19 @@ def make_line_payload(data: List[Dict[str,Any]], x_field: str="x", y_field: str=
         out_df = out_df.sort_values(by="x")
     except Exception:
         pass
-    data_out = _records_serializable(out_df)
     meta = {"title": title or f"Line {y_field} over {x_field}", "x_label": x_field, "y_label": y_field,
             "tooltip_fields":["x","y"]}
-    return {"chart_type":"line","meta":meta,"data":data_out}
-
-def _get_available_columns(data: List[Dict[str,Any]]) -> List[str]:
-    """Get available column names from data."""
-    if not data:
-        return []
-    return list(data[0].keys()) if data else []
+    if max_points and len(out_df) > max_points:
+        keep = lttb_indices(_as_axis(out_df["x"]), out_df["y"].to_numpy(dtype=float), max_points)
+        meta.update(original_points=len(out_df), downsampling="lttb")
+        out_df = out_df.iloc[keep]
+    return _payload("line", meta, out_df, columnar)
 
-def _find_numeric_column(data: List[Dict[str,Any]], preferred_names: List[str] = None) -> str:
+def _find_numeric_column(df: pd.DataFrame, preferred_names: List[str] = None) -> str:
     """Find the first numeric column in data."""
-    if not data:
+    if df.empty:
         return "value"
     
-    df = pd.DataFrame(data)
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
     
     if preferred_names:
@@ -164,13 +292,21 @@ def _find_numeric_column(data: List[Dict[str,Any]], preferred_names: List[str] =
     
     return numeric_cols[0] if numeric_cols else df.columns[0]
 
-def _find_categorical_column(data: List[Dict[str,Any]], preferred_names: List[str] = None) -> str:
-    """Find the first categorical column in data."""
-    if not data:
+def _find_categorical_column(df: pd.DataFrame, preferred_names: List[str] = None,
+                             temporal: Optional[bool] = None) -> str:
+    """Find the first categorical column in data.
+
+    `temporal=False` skips date columns (pie slices), `temporal=True` puts
+    them first (line x axis); either falls back to any non-numeric column.
+    """
+    if df.empty:
         return "category"
     
-    df = pd.DataFrame(data)
     categorical_cols = df.select_dtypes(exclude=[np.number]).columns.tolist()
+    if temporal is not None:
+        dates = [c for c in categorical_cols if _column_kind(c, df[c]) == "temporal"]
+        others = [c for c in categorical_cols if c not in dates]
+        categorical_cols = (dates + others if temporal else others) or categorical_cols
     
     if preferred_names:
         for name in preferred_names:
@@ -179,9 +315,155 @@ def _find_categorical_column(data: List[Dict[str,Any]], preferred_names: List[st
     
     return categorical_cols[0] if categorical_cols else df.columns[0]
 
-def send_to_tool(chart_type: str, data: List[Dict[str,Any]], options: Dict[str,Any]=None):
-    """Create visualization with smart field detection."""
-    if not data:
+_DATE_RE = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}.*)?$")
+_ID_RE = re.compile(r"(^id$|_id$|_code$)", re.IGNORECASE)
+PIE_MAX_CATEGORIES = 8
+HISTOGRAM_MIN_ROWS = 10
+KIND_SAMPLE_ROWS = 2000
+
+def _column_kind(name: str, s: pd.Series) -> str:
+    """numeric / temporal / categorical, tolerant to numbers and dates sent as strings."""
+    values = s.dropna()
+    if values.empty:
+        return "categorical"
+    if len(values) > KIND_SAMPLE_ROWS:
+        values = values.iloc[::len(values) // KIND_SAMPLE_ROWS]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "temporal"
+    if pd.api.types.is_bool_dtype(values):
+        return "categorical"
+    if pd.api.types.is_numeric_dtype(values):
+        return "categorical" if _ID_RE.search(str(name)) else "numeric"
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().mean() >= 0.9:
+        return "categorical" if _ID_RE.search(str(name)) else "numeric"
+    as_str = values.astype(str)
+    if as_str.str.match(_DATE_RE).mean() >= 0.9:
+        return "temporal"
+    return "categorical"
+
+def profile_frame(df: pd.DataFrame) -> List[Dict[str,Any]]:
+    """Kind, cardinality and null count of every column of a prepare_frame result."""
+    out = []
+    for col in df.columns:
+        s = df[col]
+        out.append({
+            "name": col,
+            "kind": _column_kind(col, s),
+            # numbers hash directly; other values may be unhashable, so compare them as text
+            "cardinality": int(s.nunique(dropna=True) if pd.api.types.is_numeric_dtype(s)
+                               else s.astype(str).nunique(dropna=True)),
+            "nulls": int(s.isna().sum()),
+        })
+    return out
+
+def _infer_time_freq(s: pd.Series) -> str:
+    ts = pd.to_datetime(s, errors="coerce").dropna().drop_duplicates().sort_values()
+    if len(ts) < 2:
+        return "D"
+    step = ts.diff().dropna().min()
+    if step >= pd.Timedelta(days=28):
+        return "MS"
+    if step >= pd.Timedelta(days=7):
+        return "W"
+    return "D"
+
+def recommend_chart(data, profile: Optional[List[Dict[str,Any]]]=None) -> Dict[str,Any]:
+    """Pick chart type and options from column kinds and cardinalities.
+
+    `data` is a list of rows or a frame from prepare_frame.
+    Returns {"chart_type", "options", "confident"}; when `confident` is False the
+    suggestion is only a hint and the caller should let the LLM decide.
+    """
+    if len(data) == 0:
+        return {"chart_type": "none", "options": {}, "confident": True}
+    df = prepare_frame(data)
+    profile = profile if profile is not None else profile_frame(df)
+    rows = len(df)
+    numeric = [c for c in profile if c["kind"] == "numeric"]
+    temporal = [c for c in profile if c["kind"] == "temporal"]
+    categorical = [c for c in profile if c["kind"] == "categorical"]
+
+    # a single KPI row is better told than drawn
+    if rows == 1:
+        return {"chart_type": "none", "options": {}, "confident": True}
+
+    if temporal and numeric:
+        x = temporal[0]["name"]
+        return {
+            "chart_type": "line",
+            "options": {"x_field": x, "y_field": numeric[0]["name"], "aggregate": "sum",
+                        "time_freq": _infer_time_freq(df[x])},
+            "confident": len(temporal) == 1 and len(numeric) == 1,
+        }
+
+    if categorical and numeric:
+        cat = min(categorical, key=lambda c: c["cardinality"])
+        if cat["cardinality"] <= PIE_MAX_CATEGORIES:
+            return {
+                "chart_type": "pie",
+                "options": {"group_by": cat["name"], "y_field": numeric[0]["name"], "aggregate": "sum"},
+                "confident": len(categorical) == 1 and len(numeric) == 1,
+            }
+        return {
+            "chart_type": "line",
+            "options": {"x_field": cat["name"], "y_field": numeric[0]["name"], "aggregate": "sum", "time_freq": None},
+            "confident": False,
+        }
+
+    if numeric and not categorical and not temporal:
+        if len(numeric) == 1:
+            return {
+                "chart_type": "histogram",
+                "options": {"x_field": numeric[0]["name"], "bins": 10},
+                "confident": rows >= HISTOGRAM_MIN_ROWS,
+            }
+        return {
+            "chart_type": "scatter",
+            "options": {"x_field": numeric[0]["name"], "y_field": numeric[1]["name"]},
+            "confident": len(numeric) == 2,
+        }
+
+    if len(categorical) == 1 and not numeric:
+        cat = categorical[0]
+        return {
+            "chart_type": "pie",
+            "options": {"group_by": cat["name"], "aggregate": "count"},
+            "confident": cat["cardinality"] <= PIE_MAX_CATEGORIES,
+        }
+
+    return {"chart_type": "none", "options": {}, "confident": False}
+
+def resolve_options(chart_type: str, df: pd.DataFrame, options: Dict[str,Any]=None) -> Dict[str,Any]:
+    """Chart options with every default filled in; missing fields come from smart field detection."""
+    opts = dict(options or {})
+    if chart_type == "histogram":
+        opts["x_field"] = opts.get("x_field") or _find_numeric_column(df, ["value", "count", "amount", "total"])
+        opts.setdefault("bins", 10)
+    elif chart_type == "pie":
+        opts["group_by"] = opts.get("group_by") or _find_categorical_column(df, ["category", "type", "name", "label"], temporal=False)
+        opts["y_field"] = opts.get("y_field") or _find_numeric_column(df, ["amount", "count", "value", "total"])
+        opts.setdefault("aggregate", "sum")
+    elif chart_type == "scatter":
+        opts["x_field"] = opts.get("x_field") or _find_numeric_column(df, ["x", "value", "amount"])
+        opts["y_field"] = opts.get("y_field") or _find_numeric_column(df, ["y", "count", "total"])
+    elif chart_type == "line":
+        opts["x_field"] = opts.get("x_field") or _find_categorical_column(df, ["date", "time", "dt", "x"], temporal=True)
+        opts["y_field"] = opts.get("y_field") or _find_numeric_column(df, ["value", "amount", "count", "y"])
+        opts.setdefault("aggregate", "mean")
+        opts.setdefault("time_freq", "D")
+    if chart_type in ("scatter", "line"):
+        opts["max_points"] = opts.get("max_points") or get_config().chart_max_points
+    return opts
+
+def send_to_tool(chart_type: str, data, options: Dict[str,Any]=None, columnar: bool=False):
+    """Create visualization with smart field detection.
+
+    `data` is a list of rows or a frame from prepare_frame; either way the
+    cleaned DataFrame is built once and shared by every step below. With
+    `columnar` the payload data is {"column": [...]} ("data_format": "columnar").
+    """
+    if len(data) == 0:
         return {
             "chart_type": "error",
             "meta": {"title": "No Data", "error": "No data available for visualization"},
@@ -189,7 +471,7 @@ def send_to_tool(chart_type: str, data: List[Dict[str,Any]], options: Dict[str,A
         }
     
     try:
-        data = _clean_numeric_data(data)
+        df = prepare_frame(data)
     except Exception as e:
         return {
             "chart_type": "error",
@@ -197,27 +479,19 @@ def send_to_tool(chart_type: str, data: List[Dict[str,Any]], options: Dict[str,A
             "data": []
         }
     
-    opts = options or {}
-    available_cols = _get_available_columns(data)
+    opts = resolve_options(chart_type, df, options)
     
     if chart_type == "histogram":
-        x_field = opts.get("x_field") or _find_numeric_column(data, ["value", "count", "amount", "total"])
-        return make_histogram_payload(data, x_field=x_field, bins=opts.get("bins",10), title=opts.get("title"))
+        return make_histogram_payload(df, x_field=opts["x_field"], bins=opts["bins"], title=opts.get("title"), columnar=columnar)
     
     elif chart_type == "pie":
-        group_by = opts.get("group_by") or _find_categorical_column(data, ["category", "type", "name", "label"])
-        y_field = opts.get("y_field") or _find_numeric_column(data, ["amount", "count", "value", "total"])
-        return make_pie_payload(data, group_by=group_by, y_field=y_field, aggregate=opts.get("aggregate","sum"), title=opts.get("title"))
+        return make_pie_payload(df, group_by=opts["group_by"], y_field=opts["y_field"], aggregate=opts["aggregate"], title=opts.get("title"), columnar=columnar)
     
     elif chart_type == "scatter":
-        x_field = opts.get("x_field") or _find_numeric_column(data, ["x", "value", "amount"])
-        y_field = opts.get("y_field") or _find_numeric_column(data, ["y", "count", "total"])
-        return make_scatter_payload(data, x_field=x_field, y_field=y_field, extra_fields=opts.get("extra_fields"), title=opts.get("title"))
+        return make_scatter_payload(df, x_field=opts["x_field"], y_field=opts["y_field"], extra_fields=opts.get("extra_fields"), title=opts.get("title"), max_points=opts["max_points"], columnar=columnar)
     
     elif chart_type == "line":
-        x_field = opts.get("x_field") or _find_categorical_column(data, ["date", "time", "dt", "x"])
-        y_field = opts.get("y_field") or _find_numeric_column(data, ["value", "amount", "count", "y"])
-        return make_line_payload(data, x_field=x_field, y_field=y_field, aggregate=opts.get("aggregate","mean"), time_freq=opts.get("time_freq","D"), title=opts.get("title"))
+        return make_line_payload(df, x_field=opts["x_field"], y_field=opts["y_field"], aggregate=opts["aggregate"], time_freq=opts["time_freq"], title=opts.get("title"), max_points=opts["max_points"], columnar=columnar)
     
     else:
-        raise ValueError("unsupported chart_type: " + str(chart_type))
\ No newline at end of file
+        raise ValueError("unsupported chart_type: " + str(chart_type))
@@ -1,14 +1,35 @@
 import asyncio
-from typing import Optional
+import json
+import logging
+import sys
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 from app.config import get_config
 from app.schemas import ChatRequest, ChatResponse
+from app.compact import (ARTIFACT_KEYS, columnar_artifact, compact_response, compact_steps, encode_body,
+                         rows_artifact, verbose_response)
 from app.clients.http_client import SqlAdapterClient, get_sql_adapter_client, QueryResult, SQLQuery
-from app.memory_service import memory_service
-from app.graph.factory import get_bigpt_graph
+from app.graph.factory import get_bigpt_graph, warm_up, warmup_status
+from app.graph.llm_scheduler import LLMBusy, set_request_context
+from app.singleflight import SingleFlight, coalesce_key
+from app.tracing import close_trace_export, finish_trace, register_gauge, render_metrics, span, start_trace
+
+logger = logging.getLogger(__name__)
+
+chat_flights = SingleFlight()
+register_gauge("bigpt_chat_inflight", chat_flights.inflight)
+register_gauge("bigpt_chat_executions_total", lambda: chat_flights.executions)
+register_gauge("bigpt_chat_coalesced_total", lambda: chat_flights.coalesced)
+
+
+def _memory():
+    # SQLAlchemy is imported on first use, not at process start
+    from app.memory_service import memory_service
+    return memory_service
 
 
 app = FastAPI(title="bi-gpt", version="0.1.0")
@@ -22,50 +43,113 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(LLMBusy)
+async def llm_busy(request: Request, exc: LLMBusy) -> JSONResponse:
+    # fail fast so clients retry later instead of queueing behind a saturated LLM
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "busy": True, "error": str(exc)},
+        headers={"Retry-After": "2"},
+    )
+
+
 @app.get("/health")
 async def health(request: Request) -> dict:
-    print("Client address: ", request.client.host, request.client.port)
+    logger.debug("health check from %s:%s", request.client.host, request.client.port)
     return {"status": "ok"}
 
 
-@app.post("/chat")
-async def chat(
-    body: ChatRequest,
-    request: Request,
-    response: Response,
-):
-    session_id = request.cookies.get("sessionId")
-    session_id = memory_service.get_or_create_session(session_id)
-    
+@app.get("/ready")
+async def ready(response: Response) -> dict:
+    """Readiness probe: 503 until the startup warmup has finished."""
+    status = warmup_status()
+    if not status["ready"]:
+        response.status_code = 503
+    return {"status": "ready" if status["ready"] else "warming_up", "warmup": status["steps"]}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Prometheus text exposition of span latency histograms and gauges."""
+    return render_metrics()
+
+
+def _set_session_cookie(response: Response, session_id: str) -> None:
     response.set_cookie(
         key="sessionId", 
         value=session_id, 
-        max_age=86400 * 30,  # 30 days
+        max_age=get_config().memory_session_ttl_seconds or 86400 * 365,
         httponly=True,
         samesite="lax"
     )
-    
-    memory_context = memory_service.get_session_context(session_id)
-    
-    config = get_config()
-    graph = await get_bigpt_graph(config)
 
-    user_input_with_context = body.message
-    if memory_context:
-        user_input_with_context = f"Previous conversation context:\n{memory_context}\n\nCurrent question: {body.message}"
+
+def _results():
+    # loaded together with the graph, which already needs pandas
+    from app.graph.result_store import result_store
+    return result_store
+
+
+def _charts():
+    from app.graph.chart_cache import chart_cache
+    return chart_cache
+
+
+async def _save_turn(session_id: str, message: str, state: Dict[str, Any]) -> None:
+    memory = _memory()
+    with span("memory.save", kind="db"):
+        await memory.record_turn(session_id, message, state.get("final_text", ""), state.get("sql"))
+    # later drill-downs in this session can be answered from these rows
+    await _results().put(session_id, state.get("sql"), state.get("exec_result"))
+
+
+async def _prepare_chat(body: ChatRequest, request: Request) -> Tuple[str, Dict[str, Any], str]:
+    session_id = request.cookies.get("sessionId")
+    memory = _memory()
+    with span("memory.load", kind="db"):
+        session_id = await memory.get_or_create_session(session_id)
+        conversation = await memory.get_conversation(session_id)
+    # chat requests are interactive; the client can't pick its own priority
+    set_request_context(session_id)
 
     initial_state = {
-        "user_input": user_input_with_context,
+        "user_input": body.message,
+        "session_id": session_id,
+        "conversation": conversation,
         "context": body.context or {},
         "intermediate_steps": []
     }
+    memory_context = json.dumps(conversation, ensure_ascii=False, sort_keys=True) if conversation else ""
+    return session_id, initial_state, memory_context
+
+
+async def _run_graph(initial_state: Dict[str, Any]) -> Dict[str, Any]:
+    graph = await get_bigpt_graph(get_config())
+    return await graph.ainvoke(initial_state)
+
 
-    state = await graph.ainvoke(initial_state)
+@app.post("/chat")
+async def chat(
+    body: ChatRequest,
+    request: Request,
+    verbose: bool = False,
+):
+    trace = start_trace("chat")
+    session_id, initial_state, memory_context = await _prepare_chat(body, request)
+
+    config = get_config()
+    if config.chat_coalesce:
+        # identical concurrent questions share one graph run; memory stays per session
+        key = coalesce_key(body.message, memory_context, body.context)
+        with span("graph", kind="request") as s:
+            state, shared = await chat_flights.do(key, lambda: _run_graph(initial_state))
+            s.set(coalesced=shared)
+    else:
+        state = await _run_graph(initial_state)
     
-    memory_service.add_message(session_id, body.message, "user")
-    memory_service.add_message(session_id, state.get("final_text", ""), "assistant")
+    await _save_turn(session_id, body.message, state)
 
-    return {
+    payload = {
         "success": True,
         "output": state.get("final_text"),
         "route": state.get("route"),
@@ -73,7 +157,137 @@ async def chat(
         "intermediate_steps": state.get("intermediate_steps"),
         "exec_result": state.get("exec_result"),
         "visualization": state.get("visualization"),
+        "trace": finish_trace(trace),
     }
+    compact = not (verbose or body.verbose)
+    content, encoding = encode_body(
+        compact_response(payload, body.known_charts) if compact else verbose_response(payload),
+        request.headers.get("accept-encoding", ""),
+        min_bytes=config.response_compress_min_bytes,
+        compact=compact,
+    )
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    response = Response(content=content, media_type="application/json", headers=headers)
+    _set_session_cookie(response, session_id)
+    return response
+
+
+# Nodes whose LLM output is streamed token by token to the client.
+STREAMED_TEXT_NODES = {"chitchat", "analyse"}
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _node_events(node: str, update: Dict[str, Any]) -> list:
+    if node == "classify":
+        return [("route", {"route": update.get("route")})]
+    if node in ("sql_generate", "exec") and update.get("sql"):
+        events = [("sql", {"node": node, "sql": update.get("sql")})]
+        if node == "exec":
+            events.append(("rows", update.get("exec_result")))
+        return events
+    if node in STREAMED_TEXT_NODES:
+        return [("text", {"node": node, "text": update.get("final_text")})]
+    if node == "visualize":
+        return [("visualization", update.get("visualization"))]
+    return []
+
+
+async def _stream_graph(session_id: str, message: str, initial_state: Dict[str, Any],
+                        compact: bool = True) -> AsyncIterator[str]:
+    trace = start_trace("chat_stream")
+    # the generator runs in the response's context, not the endpoint's
+    set_request_context(session_id)
+    config = get_config()
+    graph = await get_bigpt_graph(config)
+    state: Dict[str, Any] = dict(initial_state, intermediate_steps=[])
+    try:
+        async for mode, chunk in graph.astream(initial_state, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                token, metadata = chunk
+                node = metadata.get("langgraph_node")
+                text = getattr(token, "content", "")
+                if node in STREAMED_TEXT_NODES and text:
+                    yield _sse("token", {"node": node, "text": text})
+                continue
+            for node, update in (chunk or {}).items():
+                if not update:
+                    continue
+                state.update({k: v for k, v in update.items() if k != "intermediate_steps"})
+                state["intermediate_steps"].extend(update.get("intermediate_steps") or [])
+                for event, data in _node_events(node, update):
+                    if event in ("rows", "visualization") and isinstance(data, dict):
+                        data = columnar_artifact(data) if compact else rows_artifact(data)
+                    yield _sse(event, data)
+    except Exception as e:
+        yield _sse("error", {"success": False, "busy": isinstance(e, LLMBusy), "error": str(e),
+                             "trace": finish_trace(trace)})
+        return
+
+    await _save_turn(session_id, message, state)
+
+    steps = state.get("intermediate_steps")
+    artifacts = {k: state.get(k) for k in ARTIFACT_KEYS}
+    if compact:
+        # rows and visualization were already sent as their own events
+        steps = compact_steps(steps, artifacts)
+    else:
+        steps = verbose_response({**artifacts, "intermediate_steps": steps})["intermediate_steps"]
+    yield _sse("done", {
+        "success": True,
+        "output": state.get("final_text"),
+        "route": state.get("route"),
+        "sql": state.get("sql"),
+        "intermediate_steps": steps,
+        "trace": finish_trace(trace),
+    })
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    body: ChatRequest,
+    request: Request,
+    verbose: bool = False,
+):
+    session_id, initial_state, _ = await _prepare_chat(body, request)
+    events = _stream_graph(
+        session_id, body.message, initial_state,
+        compact=not (verbose or body.verbose),
+    )
+    stream_response = StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    _set_session_cookie(stream_response, session_id)
+    return stream_response
+
+
+@app.get("/charts/{chart_id}")
+async def get_chart(chart_id: str, request: Request, verbose: bool = False) -> Response:
+    """A chart payload by the chart_id it was sent with; 404 once it has been evicted."""
+    # nothing can be cached before the graph (and the cache with it) is loaded
+    payload = _charts().get(chart_id) if "app.graph.chart_cache" in sys.modules else None
+    if payload is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "chart not found"})
+    # the id is a content hash: the payload behind it never changes
+    headers = {"Vary": "Accept-Encoding", "ETag": f'"{chart_id}"', "Cache-Control": "private, max-age=86400, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    content, encoding = encode_body(
+        rows_artifact(payload) if verbose else payload,
+        request.headers.get("accept-encoding", ""),
+        min_bytes=get_config().response_compress_min_bytes,
+        compact=not verbose,
+    )
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
 
 @app.post("/exec", response_model=QueryResult)
 async def exec(
@@ -90,19 +304,39 @@ async def clear_memory(
 ):
     session_id = request.cookies.get("sessionId")
     if session_id:
-        memory_service.clear_session(session_id)
+        await _memory().clear_session(session_id)
+        if "app.graph.result_store" in sys.modules:
+            _results().clear(session_id)
         return {"success": True, "message": "Memory cleared"}
     return {"success": False, "message": "No session found"}
 
 
 
+_warmup_task: Optional[asyncio.Task] = None
+
+
+async def _warm_memory() -> None:
+    memory = await asyncio.to_thread(_memory)
+    await memory.open()
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    await asyncio.sleep(0)
+    # runs in the background so /health answers while /ready stays 503
+    global _warmup_task
+    _warmup_task = asyncio.create_task(
+        warm_up(get_config(), extra_steps={"memory": _warm_memory})
+    )
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+    if "app.memory_service" in sys.modules:
+        # flush write-behind memory before the process exits
+        await _memory().close()
+    await asyncio.to_thread(close_trace_export)
     await asyncio.sleep(0)
 
 if __name__ == "__main__":
@@ -1,110 +1,328 @@
-from sqlalchemy import create_engine, desc
-from sqlalchemy.orm import sessionmaker
-from app.models import Base, Session, Message
-from typing import List, Optional, Dict, Any
-from datetime import datetime
-import os
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import get_config
+from app.conversation import fold_turn
+from app.session_store import KVSessionStore, Op, SessionStore, SqliteSessionStore
+from app.tracing import register_gauge
+
+logger = logging.getLogger(__name__)
+
+
+def _is_session_id(value: str) -> bool:
+    try:
+        return str(uuid.UUID(value)) == value
+    except (ValueError, AttributeError, TypeError):
+        return False
+
+
+def make_session_store() -> SessionStore:
+    cfg = get_config()
+    if cfg.memory_backend == "kv":
+        return KVSessionStore.from_url(cfg.memory_kv_url, pool_size=cfg.memory_pool_size,
+                                       ttl_seconds=cfg.memory_session_ttl_seconds)
+    return SqliteSessionStore(cfg.memory_db_path, pool_size=cfg.memory_pool_size)
+
 
 class MemoryService:
-    def __init__(self, db_path: str = "memory.db"):
-        self.db_path = db_path
-        self.engine = create_engine(f"sqlite:///{db_path}", echo=False)
-        Base.metadata.create_all(self.engine)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-    
-    def get_session(self):
-        return self.SessionLocal()
-    
-    def create_session(self) -> str:
-        db = self.get_session()
-        try:
-            session = Session()
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-            return session.id
-        finally:
-            db.close()
-    
-    def get_or_create_session(self, session_id: Optional[str] = None) -> str:
-        if session_id:
-            db = self.get_session()
-            try:
-                session = db.query(Session).filter(Session.id == session_id).first()
-                if session:
-                    return session.id
-            finally:
-                db.close()
-        
-        return self.create_session()
-    
-    def add_message(self, session_id: str, content: str, sender: str) -> None:
-        db = self.get_session()
-        try:
-            message = Message(
-                session_id=session_id,
-                content=content,
-                sender=sender
-            )
-            db.add(message)
-            db.commit()
-
-            self._cleanup_old_messages(session_id)
-        finally:
-            db.close()
-    
-    def get_recent_messages(self, session_id: str, limit: int = 3) -> List[Dict[str, Any]]:
-        db = self.get_session()
-        try:
-            messages = db.query(Message).filter(
-                Message.session_id == session_id
-            ).order_by(desc(Message.timestamp)).limit(limit).all()
-            
-            return [
-                {
-                    "content": msg.content,
-                    "sender": msg.sender,
-                    "timestamp": msg.timestamp.isoformat()
-                }
-                for msg in reversed(messages)
+    """Recent messages per session with write-behind persistence to a SessionStore.
+
+    Writes are queued and flushed by a background task every `flush_interval`
+    seconds or once `flush_batch` operations are pending. With `cache_reads`
+    history is served from an in-process ring buffer; with several workers
+    sharing a store it is disabled and reads go to the store, overlaid with
+    this worker's not-yet-flushed writes.
+
+    Prompts use the per-session conversation context (app/conversation.py)
+    rather than raw messages; `record_turn` folds each finished turn into it.
+
+    Sessions are persisted lazily with their first message, and a second
+    background task purges sessions idle for `session_ttl` seconds in
+    batches of `purge_batch`, then compacts the store.
+    """
+
+    def __init__(self, store: SessionStore, history_size: int = 3, cached_sessions: int = 10000,
+                 flush_interval: float = 0.5, flush_batch: int = 200, cache_reads: bool = True,
+                 context_tokens: int = 300, session_ttl: float = 30 * 86400,
+                 purge_interval: float = 300.0, purge_batch: int = 500):
+        self.store = store
+        self.history_size = history_size
+        self.cached_sessions = cached_sessions
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.cache_reads = cache_reads
+        self.context_tokens = context_tokens
+        self.session_ttl = session_ttl
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        self.purged = 0
+        self.stats: Dict[str, float] = {}
+        self._purger: Optional[asyncio.Task] = None
+        self._contexts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._history: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._pending: List[Op] = []
+        self._inflight: List[Op] = []  # taken by a flush that has not committed yet
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    @classmethod
+    def from_config(cls) -> "MemoryService":
+        cfg = get_config()
+        return cls(
+            make_session_store(),
+            history_size=cfg.memory_history_size,
+            cached_sessions=cfg.memory_cached_sessions,
+            flush_interval=cfg.memory_flush_interval_seconds,
+            flush_batch=cfg.memory_flush_batch,
+            cache_reads=cfg.memory_cache_reads,
+            context_tokens=cfg.memory_context_tokens,
+            session_ttl=cfg.memory_session_ttl_seconds,
+            purge_interval=cfg.memory_purge_interval_seconds,
+            purge_batch=cfg.memory_purge_batch,
+        )
+
+    async def open(self) -> None:
+        await self.store.open()
+        self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flusher = asyncio.create_task(self._run())
+        if self._purger is None or self._purger.done():
+            self._purger = asyncio.create_task(self._run_purge())
+
+    # ---------- buffer ----------
+
+    def _cache(self, session_id: str, messages: List[Dict[str, Any]]) -> Deque[Dict[str, Any]]:
+        buf = deque(messages, maxlen=self.history_size)
+        self._history[session_id] = buf
+        while len(self._history) > self.cached_sessions:
+            self._history.popitem(last=False)
+        return buf
+
+    def _unflushed_ops(self) -> List[Op]:
+        return self._inflight + self._pending
+
+    def _unflushed(self, session_id: str) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for kind, sid, value in self._unflushed_ops():
+            if sid != session_id:
+                continue
+            if kind == "message":
+                out.append(value)
+            elif kind == "clear":
+                out.clear()
+        return out
+
+    async def _recent(self, session_id: str) -> List[Dict[str, Any]]:
+        if not self.cache_reads:
+            cleared = any(kind == "clear" and sid == session_id for kind, sid, _ in self._unflushed_ops())
+            stored = [] if cleared else await self.store.load_recent(session_id, self.history_size)
+            # an in-flight flush may commit while we read: skip what the store already has
+            seen = {(m["sender"], m["content"], m["timestamp"]) for m in stored}
+            unflushed = [
+                m for m in self._unflushed(session_id) if (m["sender"], m["content"], m["timestamp"]) not in seen
             ]
-        finally:
-            db.close()
-    
-    def _cleanup_old_messages(self, session_id: str) -> None:
-        db = self.get_session()
-        try:
-            all_messages = db.query(Message).filter(
-                Message.session_id == session_id
-            ).order_by(desc(Message.timestamp)).all()
-            
-            if len(all_messages) > 3:
-                messages_to_delete = all_messages[3:]
-                for msg in messages_to_delete:
-                    db.delete(msg)
-                db.commit()
-        finally:
-            db.close()
-    
-    def get_session_context(self, session_id: str) -> str:
-        messages = self.get_recent_messages(session_id, limit=3)
-        
+            return (stored + unflushed)[-self.history_size:]
+        buf = self._history.get(session_id)
+        if buf is None:
+            loaded = await self.store.load_recent(session_id, self.history_size)
+            # another request may have filled it while we were loading
+            buf = self._history.get(session_id)
+            if buf is None:
+                buf = self._cache(session_id, loaded + self._unflushed(session_id))
+        self._history.move_to_end(session_id)
+        return list(buf)
+
+    def _unflushed_context(self, session_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(found, context) from the newest unflushed context or clear op of the session."""
+        for kind, sid, value in reversed(self._unflushed_ops()):
+            if sid == session_id and kind in ("context", "clear"):
+                return True, value
+        return False, None
+
+    def _enqueue(self, op: Op) -> None:
+        self._ensure_flusher()
+        self._pending.append(op)
+        if len(self._pending) >= self.flush_batch:
+            self._wake.set()
+
+    # ---------- API ----------
+
+    async def create_session(self) -> str:
+        """A new session id; nothing is stored until its first message."""
+        session_id = str(uuid.uuid4())
+        if self.cache_reads:
+            self._cache(session_id, [])
+        return session_id
+
+    async def get_or_create_session(self, session_id: Optional[str] = None) -> str:
+        # any well-formed id is adopted without a lookup: an unknown or expired
+        # one simply starts empty and is stored with its first message
+        if session_id and _is_session_id(session_id):
+            return session_id
+        return await self.create_session()
+
+    async def add_message(self, session_id: str, content: str, sender: str) -> None:
+        message = {"content": content, "sender": sender, "timestamp": datetime.utcnow()}
+        if self.cache_reads:
+            await self._recent(session_id)
+            self._history[session_id].append(message)
+        self._enqueue(("session", session_id, message["timestamp"]))
+        self._enqueue(("message", session_id, message))
+
+    async def get_recent_messages(self, session_id: str, limit: int = 3) -> List[Dict[str, Any]]:
+        messages = (await self._recent(session_id))[-limit:] if limit > 0 else []
+        return [
+            {
+                "content": msg["content"],
+                "sender": msg["sender"],
+                "timestamp": msg["timestamp"].isoformat()
+            }
+            for msg in messages
+        ]
+
+    async def get_session_context(self, session_id: str) -> str:
+        messages = await self.get_recent_messages(session_id, limit=self.history_size)
+
         if not messages:
             return ""
-        
+
         context_parts = []
         for msg in messages:
             role = "User" if msg["sender"] == "user" else "Assistant"
             context_parts.append(f"{role}: {msg['content']}")
-        
+
         return "\n".join(context_parts)
-    
-    def clear_session(self, session_id: str) -> None:
-        db = self.get_session()
-        try:
-            db.query(Message).filter(Message.session_id == session_id).delete()
-            db.commit()
-        finally:
-            db.close()
-    
-memory_service = MemoryService()
+
+    async def get_conversation(self, session_id: str) -> Dict[str, Any]:
+        """Rolling summary and last-query facts of the session ({} when there are none)."""
+        if self.cache_reads and session_id in self._contexts:
+            self._contexts.move_to_end(session_id)
+            return self._contexts[session_id]
+        found, context = self._unflushed_context(session_id)
+        if not found:
+            context = await self.store.load_context(session_id)
+            # a turn may have been recorded while we were loading
+            found, newer = self._unflushed_context(session_id)
+            if found:
+                context = newer
+        context = context or {}
+        if self.cache_reads:
+            self._contexts[session_id] = context
+            while len(self._contexts) > self.cached_sessions:
+                self._contexts.popitem(last=False)
+        return context
+
+    async def record_turn(self, session_id: str, question: str, answer: str, sql: Optional[str] = None) -> None:
+        """Store the exchange and fold it into the session's conversation context."""
+        await self.add_message(session_id, question, "user")
+        await self.add_message(session_id, answer, "assistant")
+        context = fold_turn(await self.get_conversation(session_id), question, answer, sql, self.context_tokens)
+        if self.cache_reads:
+            self._contexts[session_id] = context
+        self._enqueue(("context", session_id, context))
+
+    async def clear_session(self, session_id: str) -> None:
+        self._contexts.pop(session_id, None)
+        buf = self._history.get(session_id)
+        if buf is not None:
+            buf.clear()
+        self._enqueue(("clear", session_id, None))
+        self._wake.set()
+
+    # ---------- persistence ----------
+
+    async def flush(self) -> int:
+        """Write pending operations; returns how many were written."""
+        if self._flush_lock is None:
+            return 0
+        # always take the lock so a caller also waits for a flush already in progress
+        async with self._flush_lock:
+            ops, self._pending = self._pending, []
+            if not ops:
+                return 0
+            self._inflight = ops
+            try:
+                await self.store.apply(ops, keep=self.history_size)
+            except Exception:
+                logger.exception("memory flush of %d ops failed, will retry", len(ops))
+                self._pending = ops + self._pending
+                return 0
+            finally:
+                self._inflight = []
+            return len(ops)
+
+    async def _run(self) -> None:
+        # wait_for may swallow a cancel that races with the wake-up, so also check the flag
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def purge_expired(self) -> int:
+        """Delete sessions idle longer than `session_ttl`; returns how many went."""
+        total = 0
+        if self.session_ttl > 0:
+            before = datetime.utcnow() - timedelta(seconds=self.session_ttl)
+            while True:
+                ids = await self.store.purge_expired(before, self.purge_batch)
+                for session_id in ids:
+                    self._history.pop(session_id, None)
+                    self._contexts.pop(session_id, None)
+                total += len(ids)
+                if len(ids) < self.purge_batch:
+                    break
+                await asyncio.sleep(0)  # short transactions: let flushes in between batches
+            if total:
+                await self.store.compact()
+                self.purged += total
+                logger.info("purged %d expired sessions", total)
+        self.stats = await self.store.stats()
+        return total
+
+    async def _run_purge(self) -> None:
+        while True:
+            try:
+                await self.purge_expired()
+            except Exception:
+                logger.exception("session purge failed")
+            await asyncio.sleep(self.purge_interval)
+
+    async def close(self) -> None:
+        if self._purger is not None:
+            self._purger.cancel()
+            try:
+                await self._purger
+            except asyncio.CancelledError:
+                pass
+            self._purger = None
+        if self._flusher is not None:
+            self._stopping = True
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+            await self.flush()
+        await self.store.close()
+
+
+memory_service = MemoryService.from_config()
+register_gauge("bigpt_memory_sessions", lambda: memory_service.stats["sessions"])
+register_gauge("bigpt_memory_db_bytes", lambda: memory_service.stats["db_bytes"])
+register_gauge("bigpt_memory_db_free_bytes", lambda: memory_service.stats["free_bytes"])
+register_gauge("bigpt_memory_sessions_purged_total", lambda: memory_service.purged)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, ForeignKey
+from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -24,4 +24,18 @@ class Message(Base):
     sender = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
-    session = relationship("Session", back_populates="messages")
\ No newline at end of file
+    session = relationship("Session", back_populates="messages")
+
+    __table_args__ = (
+        # recent-history reads and trims are always "this session, newest first"
+        Index("ix_messages_session_timestamp", "session_id", "timestamp"),
+    )
+
+
+class SessionContext(Base):
+    __tablename__ = "session_context"
+
+    # rolling summary and last-query facts (app/conversation.py), JSON encoded
+    session_id = Column(String, ForeignKey("sessions.id"), primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -4,6 +4,9 @@ from typing import Optional, List, Dict, Any
 class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
+    verbose: bool = False
+    # chart_ids the client already holds; compact responses send those charts by id only
+    known_charts: List[str] = []
 
 class ChatResponse(BaseModel):
     success: bool
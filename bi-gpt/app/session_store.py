@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ("session", session_id, created_at) | ("message", session_id, message)
+# | ("context", session_id, conversation context dict) | ("clear", session_id, None)
+Op = Tuple[str, str, Any]
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # what SQLAlchemy's DateTime writes to SQLite
+
+
+def _ts(value: datetime) -> str:
+    return value.strftime(_TS_FORMAT)
+
+
+def _parse_ts(value: Any) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class SessionStore(ABC):
+    """Durable backend for MemoryService. Messages carry content, sender and a datetime timestamp."""
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def load_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def load_context(self, session_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def apply(self, ops: List[Op], keep: int) -> None:
+        """Persist queued operations in order, keeping at most `keep` messages per touched session."""
+
+    async def purge_expired(self, before: datetime, limit: int) -> List[str]:
+        """Delete up to `limit` sessions idle since `before`; returns their ids."""
+        return []
+
+    async def compact(self) -> None:
+        """Give space freed by purges back to the filesystem."""
+
+    async def stats(self) -> Dict[str, float]:
+        return {}
+
+
+# ---------- SQLite ----------
+
+_SQLITE_TRIM = (
+    "DELETE FROM messages WHERE id IN ("
+    " SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+    "  PARTITION BY session_id ORDER BY timestamp DESC, id DESC) AS rn"
+    "  FROM messages WHERE session_id IN ({placeholders}))"
+    " WHERE rn > ?)"
+)
+
+
+def _sqlite_schema() -> List[str]:
+    # models.py stays the single schema definition
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.schema import CreateIndex, CreateTable
+
+    from app.models import Base
+
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table, if_not_exists=True).compile(dialect=sqlite.dialect())))
+        for index in table.indexes:
+            ddl.append(str(CreateIndex(index, if_not_exists=True).compile(dialect=sqlite.dialect())))
+    return ddl
+
+
+class SqliteSessionStore(SessionStore):
+    """aiosqlite store with a small connection pool, WAL and a busy timeout.
+
+    Several workers can share one database file: readers never block in WAL
+    mode and writers queue on SQLite's lock for up to `busy_timeout_ms`.
+    """
+
+    def __init__(self, db_path: str = "memory.db", pool_size: int = 4, busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.pool_size = max(1, pool_size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: list = []
+        self._open_lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        if self._pool is not None:
+            return
+        async with self._open_lock:
+            if self._pool is not None:
+                return
+            import aiosqlite
+
+            pool: asyncio.Queue = asyncio.Queue()
+            for i in range(self.pool_size):
+                conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+                await conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+                if i == 0:
+                    # auto_vacuum has to be chosen before switching to WAL
+                    await self._prepare(conn)
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                self._connections.append(conn)
+                pool.put_nowait(conn)
+            self._pool = pool
+
+    async def _prepare(self, conn) -> None:
+        async with conn.execute("SELECT COUNT(1) FROM sqlite_master WHERE type = 'table'") as cur:
+            (tables,) = await cur.fetchone()
+        if not tables:
+            # only possible before the first table exists; lets purges shrink the file
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        else:
+            async with conn.execute("PRAGMA auto_vacuum") as cur:
+                (mode,) = await cur.fetchone()
+            if mode != 2:
+                logger.warning("%s has auto_vacuum=%s; run 'PRAGMA auto_vacuum=INCREMENTAL; VACUUM;' once "
+                               "so purged sessions free disk space", self.db_path, mode)
+        for statement in _sqlite_schema():
+            await conn.execute(statement)
+
+    async def close(self) -> None:
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+        self._pool = None
+
+    @asynccontextmanager
+    async def _conn(self) -> AsyncIterator[Any]:
+        await self.open()
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def load_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        async with self._conn() as conn:
+            async with conn.execute(
+                "SELECT content, sender, timestamp FROM messages WHERE session_id = ?"
+                " ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (session_id, limit),
+            ) as cur:
+                rows = await cur.fetchall()
+        return [{"content": c, "sender": s, "timestamp": _parse_ts(t)} for c, s, t in reversed(rows)]
+
+    async def load_context(self, session_id: str) -> Optional[Dict[str, Any]]:
+        async with self._conn() as conn:
+            async with conn.execute("SELECT data FROM session_context WHERE session_id = ?", (session_id,)) as cur:
+                row = await cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def apply(self, ops: List[Op], keep: int) -> None:
+        async with self._conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                await self._apply(conn, ops, keep)
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+            await conn.execute("COMMIT")
+
+    async def _apply(self, conn, ops: List[Op], keep: int) -> None:
+        sessions: Dict[str, tuple] = {}
+        messages: List[tuple] = []
+        contexts: Dict[str, tuple] = {}
+        touched: Dict[str, str] = {}
+
+        async def write():
+            if sessions:
+                await conn.executemany(
+                    "INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+                    list(sessions.values()),
+                )
+                sessions.clear()
+            if messages:
+                await conn.executemany(
+                    "INSERT INTO messages (session_id, content, sender, timestamp) VALUES (?, ?, ?, ?)", messages
+                )
+                messages.clear()
+
+        for kind, session_id, value in ops:
+            if kind == "session":
+                sessions.setdefault(session_id, (session_id, _ts(value), _ts(value)))
+            elif kind == "message":
+                ts = _ts(value["timestamp"])
+                messages.append((session_id, value["content"], value["sender"], ts))
+                touched[session_id] = ts
+            elif kind == "context":
+                # only the newest context of a session matters
+                contexts[session_id] = (session_id, json.dumps(value, ensure_ascii=False), _ts(datetime.utcnow()))
+            elif kind == "clear":
+                # keep the op order: messages queued before the clear are cleared too
+                await write()
+                contexts.pop(session_id, None)
+                await conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                await conn.execute("DELETE FROM session_context WHERE session_id = ?", (session_id,))
+
+        await write()
+        if contexts:
+            await conn.executemany(
+                "INSERT INTO session_context (session_id, data, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                list(contexts.values()),
+            )
+        if touched:
+            await conn.executemany(
+                "UPDATE sessions SET updated_at = ? WHERE id = ?", [(ts, sid) for sid, ts in touched.items()]
+            )
+            ids = list(touched)
+            await conn.execute(_SQLITE_TRIM.format(placeholders=", ".join("?" * len(ids))), (*ids, keep))
+
+    async def purge_expired(self, before: datetime, limit: int) -> List[str]:
+        async with self._conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                async with conn.execute(
+                    "SELECT id FROM sessions WHERE updated_at < ? ORDER BY updated_at LIMIT ?", (_ts(before), limit)
+                ) as cur:
+                    ids = [row[0] for row in await cur.fetchall()]
+                if ids:
+                    placeholders = ", ".join("?" * len(ids))
+                    for table, column in (("messages", "session_id"), ("session_context", "session_id"),
+                                          ("sessions", "id")):
+                        await conn.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+            await conn.execute("COMMIT")
+        return ids
+
+    async def compact(self) -> None:
+        async with self._conn() as conn:
+            # incremental_vacuum frees one page per step; executescript steps it to the end
+            await conn.executescript("PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(PASSIVE);")
+
+    async def stats(self) -> Dict[str, float]:
+        async with self._conn() as conn:
+            values = []
+            for query in ("SELECT COUNT(1) FROM sessions", "PRAGMA page_count", "PRAGMA page_size",
+                          "PRAGMA freelist_count"):
+                async with conn.execute(query) as cur:
+                    values.append((await cur.fetchone())[0])
+        sessions, pages, page_size, free_pages = values
+        return {"sessions": sessions, "db_bytes": pages * page_size, "free_bytes": free_pages * page_size}
+
+
+# ---------- network KV ----------
+
+class KVSessionStore(SessionStore):
+    """Store on a Redis-compatible server: one list of JSON messages per session.
+
+    Appends and trims run in one MULTI/EXEC pipeline, so concurrent workers
+    never overwrite each other's history. Pass any client exposing the
+    redis.asyncio API; `from_url` builds a pooled redis client. Expiry is
+    left to the server: every write pushes the session's keys' TTL forward.
+    """
+
+    def __init__(self, client: Any, prefix: str = "bigpt", ttl_seconds: int = 0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_url(cls, url: str, pool_size: int = 10, prefix: str = "bigpt",
+                 ttl_seconds: int = 0) -> "KVSessionStore":
+        if url.startswith("local://"):
+            return cls(LocalKV(), prefix=prefix, ttl_seconds=ttl_seconds)
+        import redis.asyncio as redis  # optional dependency
+
+        client = redis.Redis.from_url(url, max_connections=pool_size, decode_responses=True)
+        return cls(client, prefix=prefix, ttl_seconds=ttl_seconds)
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    def _messages_key(self, session_id: str) -> str:
+        return f"{self.prefix}:messages:{session_id}"
+
+    def _context_key(self, session_id: str) -> str:
+        return f"{self.prefix}:context:{session_id}"
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    async def load_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        raw = await self.client.lrange(self._messages_key(session_id), -limit, -1)
+        out = []
+        for item in raw:
+            msg = json.loads(item)
+            msg["timestamp"] = _parse_ts(msg["timestamp"])
+            out.append(msg)
+        return out
+
+    async def load_context(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self._context_key(session_id))
+        return json.loads(raw) if raw else None
+
+    async def apply(self, ops: List[Op], keep: int) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        touched = set()
+        written = set()
+        for kind, session_id, value in ops:
+            if kind != "clear":
+                written.add(session_id)
+            if kind == "session":
+                pipe.set(self._session_key(session_id), _ts(value), nx=True)
+            elif kind == "message":
+                msg = {**value, "timestamp": value["timestamp"].isoformat()}
+                pipe.rpush(self._messages_key(session_id), json.dumps(msg, ensure_ascii=False))
+                touched.add(session_id)
+            elif kind == "context":
+                pipe.set(self._context_key(session_id), json.dumps(value, ensure_ascii=False))
+            elif kind == "clear":
+                pipe.delete(self._messages_key(session_id), self._context_key(session_id))
+        for session_id in touched:
+            pipe.ltrim(self._messages_key(session_id), -keep, -1)
+        if self.ttl_seconds > 0:
+            for session_id in written:
+                for key in (self._session_key(session_id), self._messages_key(session_id),
+                            self._context_key(session_id)):
+                    pipe.expire(key, self.ttl_seconds)
+        await pipe.execute()
+
+
+class LocalKV:
+    """In-process stand-in for the subset of redis.asyncio used by KVSessionStore."""
+
+    def __init__(self):
+        self.strings: Dict[str, str] = {}
+        self.lists: Dict[str, List[str]] = defaultdict(list)
+        self.deadlines: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def _alive(self, key: str) -> bool:
+        deadline = self.deadlines.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._delete(key)
+        return key in self.strings or bool(self.lists.get(key))
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.strings.get(key) if self._alive(key) else None
+
+    async def lrange(self, key: str, start: int, end: int) -> List[str]:
+        items = self.lists.get(key, []) if self._alive(key) else []
+        start = max(0, len(items) + start) if start < 0 else start
+        end = len(items) + end if end < 0 else end
+        return items[start:end + 1]
+
+    def _set(self, key: str, value: str, nx: bool = False) -> None:
+        if not (nx and self._alive(key)):
+            self.strings[key] = value
+
+    def _rpush(self, key: str, value: str) -> None:
+        self._alive(key)
+        self.lists[key].append(value)
+
+    def _ltrim(self, key: str, start: int, end: int) -> None:
+        items = self.lists.get(key, [])
+        start = max(0, len(items) + start) if start < 0 else start
+        end = len(items) + end if end < 0 else end
+        self.lists[key] = items[start:end + 1]
+
+    def _expire(self, key: str, seconds: int) -> None:
+        if key in self.strings or key in self.lists:
+            self.deadlines[key] = time.monotonic() + seconds
+
+    def _delete(self, *keys: str) -> None:
+        for key in keys:
+            self.strings.pop(key, None)
+            self.lists.pop(key, None)
+            self.deadlines.pop(key, None)
+
+    def pipeline(self, transaction: bool = True) -> "_LocalPipeline":
+        return _LocalPipeline(self)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _LocalPipeline:
+    def __init__(self, kv: LocalKV):
+        self.kv = kv
+        self.calls: List[tuple] = []
+
+    def __getattr__(self, name: str):
+        target = getattr(self.kv, "_" + name)
+        return lambda *args, **kwargs: self.calls.append((target, args, kwargs))
+
+    async def execute(self) -> None:
+        async with self.kv._lock:
+            for fn, args, kwargs in self.calls:
+                fn(*args, **kwargs)
+        self.calls.clear()
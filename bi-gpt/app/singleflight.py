@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    text = _WS_RE.sub(" ", (text or "").lower().replace("ё", "е")).strip()
+    return text.rstrip("?!. ")
+
+
+def coalesce_key(message: str, memory_context: str, context: Any = None) -> str:
+    """Same question asked with the same conversation context -> same key."""
+    context_version = hashlib.sha256((memory_context or "").encode("utf-8")).hexdigest()[:16]
+    raw = json.dumps([normalize_question(message), context_version, context], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution.
+
+    The work runs in its own task, so a caller that disconnects does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, shared) where shared is True for callers that joined an existing run."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
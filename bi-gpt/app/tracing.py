@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# seconds; shared by every span histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# traces waiting for the export thread; beyond this they are dropped, not queued
+EXPORT_QUEUE_SIZE = 1000
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return round(((self.end or time.time()) - self.start) * 1000, 2)
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Span in OTLP/JSON field naming, one per line in the export file."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": int(self.start * 1e9),
+            "endTimeUnixNano": int((self.end or self.start) * 1e9),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attrs.items()],
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+@dataclass
+class Trace:
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    start: float = field(default_factory=time.time)
+    spans: List[Span] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((time.time() - self.start) * 1000, 2),
+            "tokens": {
+                "input": sum(s.attrs.get("input_tokens", 0) for s in self.spans),
+                "output": sum(s.attrs.get("output_tokens", 0) for s in self.spans),
+            },
+            "spans": [
+                {"name": s.name, "kind": s.kind, "ms": s.duration_ms,
+                 "offset_ms": round((s.start - self.start) * 1000, 2), **s.attrs,
+                 **({"error": s.error} if s.error else {})}
+                for s in self.spans
+            ],
+        }
+
+
+class Histograms:
+    """Prometheus-style latency histograms keyed by (kind, name)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def observe(self, kind: str, name: str, seconds: float) -> None:
+        with self._lock:
+            h = self._data.setdefault((kind, name), {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            idx = bisect_left(self.buckets, seconds)
+            if idx < len(self.buckets):
+                h["counts"][idx] += 1
+            h["sum"] += seconds
+            h["count"] += 1
+
+    def render(self, metric: str = "bigpt_span_duration_seconds") -> List[str]:
+        lines = [f"# TYPE {metric} histogram"]
+        with self._lock:
+            for (kind, name), h in sorted(self._data.items()):
+                labels = f'kind="{kind}",name="{name}"'
+                cumulative = 0
+                for bound, c in zip(self.buckets, h["counts"]):
+                    cumulative += c
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h["count"]}')
+                lines.append(f"{metric}_sum{{{labels}}} {h['sum']:.6f}")
+                lines.append(f"{metric}_count{{{labels}}} {h['count']}")
+        return lines
+
+
+class TraceExporter:
+    """Appends spans as JSONL from a background thread; the file rotates by size.
+
+    Requests only enqueue their spans. When the writer falls behind, whole
+    traces are dropped and counted instead of blocking the event loop.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int, queue_size: int = EXPORT_QUEUE_SIZE):
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                            encoding="utf-8", delay=True)
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        if not spans:
+            return
+        try:
+            self._queue.put_nowait("\n".join(json.dumps(s.to_otlp(), ensure_ascii=False) for s in spans))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            lines = self._queue.get()
+            if lines is None:
+                break
+            try:
+                # the handler rolls the file over before a write would pass max_bytes
+                self._handler.handle(logging.makeLogRecord({"msg": lines}))
+            except Exception:
+                logger.exception("trace export failed")
+        self._handler.close()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what is queued and stop the thread (blocking; run it off the loop)."""
+        self._queue.put(None, timeout=timeout)
+        self._thread.join(timeout)
+
+
+histograms = Histograms()
+_gauges: Dict[str, Callable[[], float]] = {}
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_exporter: Optional[TraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def register_gauge(name: str, fn: Callable[[], float]) -> None:
+    """Expose `fn()` as a gauge on /metrics."""
+    _gauges[name] = fn
+
+
+def start_trace(name: str) -> Trace:
+    trace = Trace(name=name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def _trace_exporter() -> Optional[TraceExporter]:
+    global _exporter
+    config = get_config()
+    if not config.trace_export_path:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            exporter = TraceExporter(config.trace_export_path, config.trace_export_max_bytes,
+                                     config.trace_export_backups)
+            register_gauge("bigpt_trace_export_dropped_total", lambda: exporter.dropped)
+            _exporter = exporter
+        return _exporter
+
+
+def close_trace_export() -> None:
+    """Flush and stop the export thread, if one was started."""
+    global _exporter
+    with _exporter_lock:
+        exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.close()
+
+
+def finish_trace(trace: Trace) -> Dict[str, Any]:
+    """Queue the trace's spans for the JSONL export (if configured) and return its summary."""
+    exporter = _trace_exporter()
+    if exporter is not None:
+        exporter.submit(trace.spans)
+    return trace.summary()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs: Any) -> Iterator[Span]:
+    """Time a block; recorded on the current trace (if any) and in the histograms."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    s = Span(name=name, kind=kind, trace_id=trace.trace_id if trace else "",
+             parent_id=parent.span_id if parent else None)
+    s.set(**attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end = time.time()
+        _current_span.reset(token)
+        histograms.observe(kind, name, s.end - s.start)
+        if trace is not None:
+            trace.spans.append(s)
+
+
+def payload_size(obj: Any) -> int:
+    try:
+        return len(json.dumps(obj, ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return len(str(obj))
+
+
+def traced_node(name: str, fn: Callable) -> Callable:
+    """Wrap an async graph node in a 'node' span that records its output size."""
+    @wraps(fn)
+    async def wrapper(state):
+        with span(name, kind="node") as s:
+            update = await fn(state)
+            s.set(output_bytes=payload_size(update))
+            return update
+    return wrapper
+
+
+def render_metrics() -> str:
+    lines = histograms.render()
+    for name, fn in sorted(_gauges.items()):
+        try:
+            value = float(fn())
+        except Exception:
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
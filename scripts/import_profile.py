@@ -0,0 +1,103 @@
+"""Import-time profile for the bi-gpt and sql-mcp entry points.
+
+    python scripts/import_profile.py                 # top imports per entry point
+    python scripts/import_profile.py --check         # exit 1 if any entry point is over budget
+
+Each module is imported in a fresh interpreter with `-X importtime`; the
+reported time is the median of --runs cumulative timings. Budgets can be
+overridden per entry point with IMPORT_BUDGET_MS_<NAME> (e.g.
+IMPORT_BUDGET_MS_BI_GPT=800) or for all of them with --budget-ms.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (working directory, module, default budget in ms)
+ENTRY_POINTS: Dict[str, Tuple[str, str, float]] = {
+    "bi-gpt": ("bi-gpt", "app.main", 1500.0),
+    "sql-mcp": ("sql-mcp", "main", 1000.0),
+    "sql-mcp-server": ("sql-mcp", "mcp_server", 2500.0),
+}
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(cwd: str, module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Cumulative import time of `module` in ms, plus (ms, name) for every imported module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(ROOT, cwd), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        cumulative_ms = int(m.group(2)) / 1000
+        rows.append((cumulative_ms, m.group(4)))
+        if m.group(4) == module:
+            total = cumulative_ms
+    return total, rows
+
+
+def budget_for(name: str, default: float, override: float = None) -> float:
+    env = os.getenv("IMPORT_BUDGET_MS_" + re.sub(r"\W", "_", name).upper())
+    if env:
+        return float(env)
+    return override if override is not None else default
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entry_points", nargs="*", metavar="ENTRY_POINT",
+                        help=f"one of {', '.join(ENTRY_POINTS)} (default: all)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list per entry point")
+    parser.add_argument("--check", action="store_true", help="fail when an entry point is over budget")
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+    unknown = [n for n in args.entry_points if n not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(unknown)}")
+
+    over = []
+    for name in args.entry_points or list(ENTRY_POINTS):
+        cwd, module, default_budget = ENTRY_POINTS[name]
+        try:
+            runs = [profile(cwd, module) for _ in range(max(1, args.runs))]
+        except RuntimeError as e:
+            print(f"{name}: {e}", file=sys.stderr)
+            over.append(name)
+            continue
+        total = statistics.median(t for t, _ in runs)
+        budget = budget_for(name, default_budget, args.budget_ms)
+        status = "OK" if total <= budget else "OVER BUDGET"
+        print(f"{name} ({module}): {total:.0f} ms, budget {budget:.0f} ms  {status}")
+        if not args.check:
+            # slowest top-level packages from the last run
+            seen = {}
+            for ms, mod in runs[-1][1]:
+                top = mod.split(".")[0]
+                seen[top] = max(seen.get(top, 0.0), ms)
+            for mod, ms in sorted(seen.items(), key=lambda kv: -kv[1])[:args.top]:
+                print(f"    {ms:8.1f} ms  {mod}")
+        if total > budget:
+            over.append(name)
+
+    if args.check and over:
+        print("over budget: " + ", ".join(over), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
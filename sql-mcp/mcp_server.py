@@ -24,7 +24,8 @@ def execute_query(request: SQLQuery) -> QueryResult:
             success=result.success,
             data=result.data,
             row_count=result.row_count,
-            error=result.error
+            error=result.error,
+            columns=result.columns
         )
     except Exception as e:
         return QueryResult(
@@ -71,4 +71,19 @@ class PolicyManager:
         return self._data.get("enumerables", [])
 
 
-policy_manager = PolicyManager()
+_policy_manager: Optional[PolicyManager] = None
+
+
+def get_policy_manager() -> PolicyManager:
+    """Process-wide PolicyManager, loaded from POLICY_FILE on first use."""
+    global _policy_manager
+    if _policy_manager is None:
+        _policy_manager = PolicyManager()
+    return _policy_manager
+
+
+def __getattr__(name: str):
+    # keeps `from policies import policy_manager` working without loading at import time
+    if name == "policy_manager":
+        return get_policy_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -23,6 +23,8 @@ class QueryResult(BaseModel):
     data: Optional[List[Dict[str, Any]]] = None
     error: Optional[str] = None
     row_count: Optional[int] = None
+    # [{"name": ..., "type": postgres type name}] in result order
+    columns: Optional[List[Dict[str, str]]] = None
 
 class MetaInfo(BaseModel):
     success: bool
@@ -4,17 +4,29 @@ import os
 from dotenv import load_dotenv
 from schemas import SQLQuery, QueryResult, ExplainResult, MetaInfo, PolicyInfo
 from explain_tools import flatten_plan_nodes, collect_relations, fetch_relation_sizes, estimate_bytes_scanned, generate_warnings
-from policies import policy_manager
-import sqlglot
+from policies import PolicyManager, get_policy_manager
+from sqlpolicy import validate_sql
 from typing import Optional, Dict, Any, List
 
 load_dotenv()
 
+# result column type OIDs -> postgres type names; anything else is reported as "unknown"
+TYPE_NAMES = {
+    16: "bool", 20: "int8", 21: "int2", 23: "int4", 25: "text", 114: "json", 700: "float4",
+    701: "float8", 790: "money", 1042: "bpchar", 1043: "varchar", 1082: "date", 1083: "time",
+    1114: "timestamp", 1184: "timestamptz", 1700: "numeric", 2950: "uuid", 3802: "jsonb",
+}
+
+
+def result_columns(description) -> List[Dict[str, str]]:
+    return [{"name": d.name, "type": TYPE_NAMES.get(d.type_code, "unknown")} for d in description or []]
+
 
 class DatabaseService:
     
-    def __init__(self):
-        self.policy_manager = policy_manager
+    @property
+    def policy_manager(self) -> PolicyManager:
+        return get_policy_manager()
     
     def get_db_connection(self):
         try:
@@ -34,42 +46,13 @@ class DatabaseService:
             raise Exception(f"Database connection failed: {str(e)}")
     
     def validate_sql_query(self, sql: str) -> tuple[bool, List[str]]:
-        violations = []
-        
-        try:
-            expr = sqlglot.parse_one(sql, dialect="postgres")
-        except Exception as e:
-            return False, [f"SQL parse error: {e}"]
-        
-        from sqlglot import exp
-        if not isinstance(expr, exp.Select) and not expr.find(exp.Select, bfs=True):
-            return False, ["Only SELECT statements are allowed"]
-        
-        stars = list(expr.find_all(exp.Star))
-        for s in stars:
-            func_parent = s.find_ancestor(exp.Func)
-            print(f"func_parent: {func_parent}")
-            if func_parent and func_parent.name == "COUNT" and func_parent.args[0].name == "*":
-                continue
-            violations.append("Wildcard '*' in projection is forbidden. List columns explicitly.")
-        
-        tables = [t.name for t in expr.find_all(exp.Table)]
-        for t in tables:
-            if not self.policy_manager.validate_table(t):
-                violations.append(f"Table '{t}' is not allowed")
-        
-        cols = [c.name for c in expr.find_all(exp.Column)]
-        for c in cols:
-            if not self.policy_manager.validate_column(c):
-                violations.append(f"Column '{c}' is forbidden by policy")
-        
-        funcs = [f.name for f in expr.find_all(exp.Func) if f.name]
-        allowed_funcs = {f.lower() for f in self.policy_manager.allow_functions}
-        for f in funcs:
-            if allowed_funcs and f.lower() not in allowed_funcs:
-                violations.append(f"Function '{f}' is not allowed")
-        
-        return len(violations) == 0, violations
+        violations = validate_sql(
+            sql,
+            allow_tables=self.policy_manager.allow_tables,
+            deny_columns=self.policy_manager.deny_columns,
+            allow_functions=self.policy_manager.allow_functions,
+        )
+        return len(violations) == 0, [v.message for v in violations]
     
     def execute_query(self, query_data: SQLQuery) -> QueryResult:
         conn = None
@@ -86,7 +69,8 @@ class DatabaseService:
             cur.execute(sql)
             rows = cur.fetchall()
             data = [dict(row) for row in rows]
-            return QueryResult(success=True, data=data, row_count=len(data))
+            return QueryResult(success=True, data=data, row_count=len(data),
+                               columns=result_columns(cur.description))
             
         except Exception as e:
             if conn:
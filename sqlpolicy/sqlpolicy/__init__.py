@@ -0,0 +1,68 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List
+
+# Policy checks for generated SQL. sql-mcp enforces them before explain/exec;
+# bi-gpt runs the same checks in-process to reject a query without the round trip.
+
+__all__ = ["Violation", "validate_sql", "validate_with_policies"]
+
+
+@dataclass(frozen=True)
+class Violation:
+    rule: str
+    target: str
+    message: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def validate_sql(sql: str, allow_tables: Iterable[str], deny_columns: Iterable[str],
+                 allow_functions: Iterable[str]) -> List[Violation]:
+    # sqlglot is imported on first use to keep it off the startup import path
+    import sqlglot
+    from sqlglot import exp
+
+    try:
+        expr = sqlglot.parse_one(sql, dialect="postgres")
+    except Exception as e:
+        return [Violation("parse", "", f"SQL parse error: {e}")]
+
+    if not isinstance(expr, exp.Select) and not expr.find(exp.Select, bfs=True):
+        return [Violation("statement", expr.key, "Only SELECT statements are allowed")]
+
+    violations: List[Violation] = []
+
+    for s in expr.find_all(exp.Star):
+        func_parent = s.find_ancestor(exp.Func)
+        if func_parent and func_parent.name == "COUNT" and func_parent.args[0].name == "*":
+            continue
+        violations.append(Violation("wildcard", "*", "Wildcard '*' in projection is forbidden. List columns explicitly."))
+
+    allowed_tables = set(allow_tables)
+    for t in (t.name for t in expr.find_all(exp.Table)):
+        if t not in allowed_tables:
+            violations.append(Violation("table", t, f"Table '{t}' is not allowed"))
+
+    denied_columns = set(deny_columns)
+    for c in (c.name for c in expr.find_all(exp.Column)):
+        if c in denied_columns:
+            violations.append(Violation("column", c, f"Column '{c}' is forbidden by policy"))
+
+    allowed_funcs = {f.lower() for f in allow_functions}
+    for f in (f.name for f in expr.find_all(exp.Func) if f.name):
+        if allowed_funcs and f.lower() not in allowed_funcs:
+            violations.append(Violation("function", f, f"Function '{f}' is not allowed"))
+
+    return violations
+
+
+def validate_with_policies(sql: str, policies: Dict[str, Any]) -> List[Violation]:
+    """Validate against a get_policies payload (wrapped or bare policies dict)."""
+    policies = policies.get("policies", policies) if policies else {}
+    return validate_sql(
+        sql,
+        allow_tables=policies.get("allow_tables") or [],
+        deny_columns=policies.get("deny_columns") or [],
+        allow_functions=policies.get("allow_functions") or [],
+    )